@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark parallel blob ingest (vctrl.ingest.hash_files).
+
+Builds a throwaway repository with a mix of small and large files and
+times `hash_files` with 1, 4 and N workers.
+
+    python benchmarks/bench_ingest.py --small 5000 --large 16
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from vctrl.ingest import hash_files, default_jobs  # noqa: E402
+
+
+def make_files(root, small, large, small_size, large_size):
+    paths = []
+    for i in range(small):
+        path = os.path.join(root, f"small_{i:06d}.txt")
+        with open(path, "wb") as f:
+            f.write(os.urandom(small_size // 2).hex().encode())
+        paths.append(path)
+    for i in range(large):
+        path = os.path.join(root, f"large_{i:03d}.bin")
+        with open(path, "wb") as f:
+            # Half random, half repeated so zlib has real work to do
+            f.write(os.urandom(large_size // 2) + b"vctrl" * (large_size // 10))
+        paths.append(path)
+    return paths
+
+
+def run(paths, jobs, objects_dir):
+    shutil.rmtree(objects_dir)
+    os.makedirs(objects_dir)
+    start = time.perf_counter()
+    hash_files(paths, jobs=jobs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--small", type=int, default=5000, help="Number of small files")
+    parser.add_argument("--large", type=int, default=16, help="Number of large files")
+    parser.add_argument("--small-size", type=int, default=4096)
+    parser.add_argument("--large-size", type=int, default=8 << 20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vctrl-bench-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        objects_dir = os.path.join(workdir, ".vctrl", "objects")
+        os.makedirs(objects_dir)
+        paths = make_files(workdir, args.small, args.large, args.small_size, args.large_size)
+        total = sum(os.path.getsize(p) for p in paths)
+
+        print(f"{len(paths)} files, {total / 1e6:.1f} MB")
+        print(f"{'jobs':>6} {'best (s)':>10} {'MB/s':>10} {'speedup':>8}")
+        baseline = None
+        for jobs in sorted({1, 4, default_jobs()}):
+            best = min(run(paths, jobs, objects_dir) for _ in range(args.repeat))
+            baseline = baseline or best
+            print(f"{jobs:>6} {best:>10.3f} {total / best / 1e6:>10.1f} {baseline / best:>7.2f}x")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
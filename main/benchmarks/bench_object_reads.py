@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark random-access object reads from loose, packed and
+mmap-packed storage.
+
+    python benchmarks/bench_object_reads.py --objects 5000 --reads 20000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from vctrl import pack  # noqa: E402
+from vctrl.cache import object_cache, parse_size  # noqa: E402
+from vctrl.repo import init  # noqa: E402
+from vctrl.objects import hash_object, load_object  # noqa: E402
+from vctrl.commands.gc import repack  # noqa: E402
+
+
+def make_objects(count, rng):
+    # Several versions of each "file" so the pack contains real delta chains
+    oids = []
+    files = max(1, count // 5)
+    for i in range(files):
+        lines = [f"file {i} line {n} {rng.random()}\n" for n in range(rng.randint(20, 200))]
+        for version in range(count // files):
+            lines[rng.randrange(len(lines))] = f"version {version} {rng.random()}\n"
+            oids.append(hash_object("".join(lines).encode()))
+    return oids
+
+
+def time_reads(sample):
+    object_cache.clear()
+    start = time.perf_counter()
+    for oid in sample:
+        load_object(oid)
+    return time.perf_counter() - start
+
+
+def reset_packs(use_mmap):
+    for _, found in pack._packs.values():
+        for existing in found:
+            existing.close()
+    pack._packs.clear()
+    pack.USE_MMAP = use_mmap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--objects", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--window", type=int, default=pack.DELTA_WINDOW,
+                        help="Delta window used when packing (0 disables deltas)")
+    parser.add_argument("--cache-bytes", default=str(object_cache.max_bytes),
+                        help="Object cache budget, e.g. 0 or 64M (the cache is emptied before each run)")
+    args = parser.parse_args()
+    pack.DELTA_WINDOW = args.window
+    object_cache.max_bytes = parse_size(args.cache_bytes)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="vctrl-bench-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            init(workdir)
+        oids = make_objects(args.objects, rng)
+        sample = [rng.choice(oids) for _ in range(args.reads)]
+
+        results = [("loose", time_reads(sample))]
+        repack()
+        reset_packs(use_mmap=False)
+        results.append(("packed", time_reads(sample)))
+        reset_packs(use_mmap=True)
+        results.append(("packed+mmap", time_reads(sample)))
+        reset_packs(use_mmap=True)
+
+        print(f"{len(oids)} objects, {len(sample)} random reads")
+        print(f"{'storage':>12} {'total (s)':>10} {'us/read':>10}")
+        for name, elapsed in results:
+            print(f"{name:>12} {elapsed:>10.3f} {elapsed / len(sample) * 1e6:>10.1f}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark CLI startup, in-process and through `vctrl daemon`.
+
+Builds a throwaway repository, then times whole `vctrl` invocations
+(interpreter start included) for `--help`, `branch` and `status`, first
+without a daemon and then with one running. The slowest imports behind
+`vctrl status` are listed from `python -X importtime`.
+
+    python benchmarks/bench_startup.py --files 2000 --runs 20
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+COMMANDS = [["--help"], ["branch"], ["status"]]
+
+
+def vctrl(args, cwd, env, **kwargs):
+    return subprocess.run([sys.executable, "-m", "vctrl.cli", *args], cwd=cwd, env=env,
+                          stdout=subprocess.DEVNULL, **kwargs)
+
+
+def make_repo(root, files, env):
+    vctrl(["init"], root, env, check=True)
+    for i in range(files):
+        directory = os.path.join(root, f"dir_{i // 100:03d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file_{i:05d}.txt"), "w") as f:
+            f.write(f"line {i}\n" * 8)
+    vctrl(["add", "."], root, env, check=True)
+    vctrl(["commit", "-m", "initial"], root, env, check=True)
+    vctrl(["status"], root, env, check=True)  # refresh racily clean index entries
+
+
+def timings(args, cwd, env, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        vctrl(args, cwd, env, check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def slowest_imports(cwd, env, count):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "vctrl.cli", "status"],
+                            cwd=cwd, env={**env, "VCTRL_NO_DAEMON": "1"},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def report(label, cwd, env, runs):
+    print(f"\n{label}")
+    print(f"{'command':>10} {'median (ms)':>12} {'min (ms)':>10}")
+    for args in COMMANDS:
+        samples = timings(args, cwd, env, runs)
+        print(f"{' '.join(args):>10} {statistics.median(samples) * 1000:>12.1f} {min(samples) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000, help="Files in the repository")
+    parser.add_argument("--runs", type=int, default=20, help="Invocations per command")
+    parser.add_argument("--imports", type=int, default=8, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vctrl-bench-")
+    env = {**os.environ, "PYTHONPATH": os.path.abspath(ROOT)}
+    try:
+        make_repo(workdir, args.files, env)
+        report("in-process", workdir, {**env, "VCTRL_NO_DAEMON": "1"}, args.runs)
+
+        vctrl(["daemon", "start", "--detach"], workdir, env, check=True)
+        try:
+            report("daemon", workdir, env, args.runs)
+        finally:
+            vctrl(["daemon", "stop"], workdir, env)
+
+        print(f"\n{'self (ms)':>10} {'total (ms)':>11}  slowest imports for `status`")
+        for self_us, cumulative, name in slowest_imports(workdir, env, args.imports):
+            print(f"{self_us / 1000:>10.1f} {cumulative / 1000:>11.1f}  {name}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: end-to-end commands and object-store microbenchmarks on a
+synthetic repository.
+
+Builds a throwaway repository of the requested shape (file count, directory
+depth and width, log-normal file sizes, history length), then:
+
+  - times `add .`, `commit`, `status`, `diff`, `checkout` and `merge` as
+    separate `vctrl` processes (interpreter start included), with each
+    process's peak RSS
+  - microbenchmarks hash_object, get_object (cold and warm cache),
+    write_tree (full and incremental) and checkout_tree in-process
+
+and reports p50/p99 latency and throughput. With --output the results are
+saved as JSON for benchmarks/compare.py.
+
+    python benchmarks/bench_suite.py --files 5000 --history 20 --output before.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from harness import (Shape, make_content, write_tree_files, touch_files, run_cli,  # noqa: E402
+                     summarize, self_peak_rss_kb, ROOT)
+from vctrl.repo import Repository, REPO_DIR  # noqa: E402
+
+
+# Time `vctrl <args>` `runs` times, calling setup() (untimed) before each run
+def end_to_end(name, root, args, runs, setup=None, work=None, work_unit=None):
+    samples, peak = [], 0
+    for i in range(runs):
+        if setup:
+            setup(i)
+        elapsed, rss = run_cli(args(i) if callable(args) else args, root)
+        samples.append(elapsed)
+        peak = max(peak, rss)
+    return name, summarize(samples, work, work_unit, peak_rss_kb=peak)
+
+
+# Time fn() `iterations` times in this process, calling setup() (untimed)
+# before each call
+def micro(name, iterations, fn, setup=None, work=None, work_unit=None):
+    samples = []
+    for i in range(iterations):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return name, summarize(samples, work, work_unit)
+
+
+def reinit(root):
+    shutil.rmtree(os.path.join(root, REPO_DIR), ignore_errors=True)
+    run_cli(["init", root], root)
+
+
+def head(root, ref="HEAD"):
+    return Repository(os.path.join(root, REPO_DIR)).get_ref(ref)
+
+
+# `add .` and `commit` on a repository with no objects yet
+def initial_suite(root, shape, total_bytes, runs):
+    def fresh(i):
+        reinit(root)
+
+    def fresh_added(i):
+        reinit(root)
+        run_cli(["add", "."], root)
+
+    return [
+        end_to_end("add_initial", root, ["add", "."], runs, fresh, total_bytes / 1e6, "MB"),
+        end_to_end("commit_initial", root, ["commit", "-m", "initial"], runs, fresh_added,
+                   shape.files, "files"),
+    ]
+
+
+# A fresh repository with `history` commits on main, each editing `churn`
+# files, and a branch "old" at the first commit. Returns (first, last).
+def build_history(root, shape, paths, rng):
+    reinit(root)
+    run_cli(["add", "."], root)
+    run_cli(["commit", "-m", "initial"], root)
+    first = head(root)
+    for i in range(shape.history):
+        touch_files(root, paths, shape.churn, rng, f"history {i}")
+        run_cli(["add", "."], root)
+        run_cli(["commit", "-m", f"history {i}"], root)
+    run_cli(["branch", "-b", "old"], root)
+    with open(os.path.join(root, REPO_DIR, "refs", "heads", "old"), "w") as f:
+        f.write(first)
+    return first, head(root)
+
+
+def history_suite(root, shape, paths, rng, first, last, runs):
+    results = [end_to_end("add_unchanged", root, ["add", "."], runs, work=shape.files,
+                          work_unit="files")]
+
+    def edit(i):
+        touch_files(root, paths, shape.churn, rng, f"add {i}")
+    results.append(end_to_end("add_changed", root, ["add", "."], runs, edit))
+
+    def edit_and_add(i):
+        touch_files(root, paths, shape.churn, rng, f"commit {i}")
+        run_cli(["add", "."], root)
+    results.append(end_to_end("commit", root, lambda i: ["commit", "-m", f"bench {i}"], runs,
+                              edit_and_add))
+
+    # Leave some unstaged edits for status and diff to find
+    touch_files(root, paths, shape.churn, rng, "dirty")
+    results.append(end_to_end("status", root, ["status", "--porcelain"], runs,
+                              work=shape.files, work_unit="files"))
+    results.append(end_to_end("diff_worktree", root, ["diff", "-p"], runs))
+    results.append(end_to_end("diff_commits", root, ["diff", first, last], runs))
+    run_cli(["add", "."], root)
+    run_cli(["commit", "-m", "clean"], root)
+
+    # Switch back and forth between the tip and the first commit
+    results.append(end_to_end("checkout", root,
+                              lambda i: ["checkout", "old" if i % 2 == 0 else "main"],
+                              runs + runs % 2))
+
+    # A clean three-way merge: both sides edit different files
+    base = head(root)
+    run_cli(["branch", "-b", "feature"], root)
+    run_cli(["checkout", "feature"], root)
+    half = len(paths) // 2
+    touch_files(root, paths[:half], shape.churn, rng, "feature")
+    run_cli(["add", "."], root)
+    run_cli(["commit", "-m", "feature"], root)
+    run_cli(["checkout", "main"], root)
+    touch_files(root, paths[half:], shape.churn, rng, "main")
+    run_cli(["add", "."], root)
+    run_cli(["commit", "-m", "main"], root)
+    main_tip = head(root)
+    main_ref = os.path.join(root, REPO_DIR, "refs", "heads", "main")
+
+    def rewind(i):
+        # Undo the previous sample's merge commit
+        if head(root) != main_tip:
+            with open(main_ref, "w") as f:
+                f.write(main_tip)
+            run_cli(["checkout", "main"], root)
+    results.append(end_to_end("merge", root, ["merge", "main", "feature"], runs, rewind))
+    return results
+
+
+def micro_suite(root, iterations, rng):
+    from vctrl.cache import object_cache
+    from vctrl.index import load_index, write_index, invalidate_cache_tree
+    from vctrl.objects import hash_object, get_object, write_tree, read_commit, iter_loose_objects
+    from vctrl.commands.checkout import checkout_tree
+
+    results = []
+    small = [make_content(rng, 1024) for _ in range(iterations)]
+    results.append(micro("hash_object_1k", iterations, lambda i: hash_object(small[i]),
+                         work=1024 / 1e6, work_unit="MB"))
+    large_count = max(3, iterations // 20)
+    large = [make_content(rng, 1 << 20) for _ in range(large_count)]
+    results.append(micro("hash_object_1m", large_count, lambda i: hash_object(large[i]),
+                         work=1.0, work_unit="MB"))
+
+    oids = [oid for oid, _ in iter_loose_objects()]
+    sample = [rng.choice(oids) for _ in range(iterations)]
+    results.append(micro("get_object_cold", iterations, lambda i: get_object(sample[i]),
+                         setup=lambda i: object_cache.clear()))
+    get_object(sample[0])
+    results.append(micro("get_object_warm", iterations, lambda i: get_object(sample[0])))
+
+    entries, cache_tree = load_index()
+    paths = list(entries)
+
+    def drop_cache_tree(i):
+        write_index(entries, {})
+    tree_iterations = max(3, iterations // 20)
+    results.append(micro("write_tree_full", tree_iterations, lambda i: write_tree(),
+                         setup=drop_cache_tree, work=len(paths), work_unit="files"))
+
+    def drop_one_directory(i):
+        current, tree = load_index()
+        invalidate_cache_tree(tree, rng.choice(paths))
+        write_index(current, tree)
+    results.append(micro("write_tree_incremental", iterations, lambda i: write_tree(),
+                         setup=drop_one_directory))
+
+    trees = [read_commit(head(root, "refs/heads/old")).tree,
+             read_commit(head(root, "refs/heads/main")).tree]
+    checkout_tree(trees[1])
+    results.append(micro("checkout_tree", tree_iterations + tree_iterations % 2,
+                         lambda i: checkout_tree(trees[i % 2])))
+    checkout_tree(trees[1])
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                              capture_output=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000, help="Files in the working tree")
+    parser.add_argument("--depth", type=int, default=3, help="Directory nesting depth")
+    parser.add_argument("--width", type=int, default=4, help="Subdirectories per directory")
+    parser.add_argument("--median-size", type=int, default=2048, help="Median file size in bytes")
+    parser.add_argument("--size-sigma", type=float, default=1.0,
+                        help="Spread of the log-normal file size distribution")
+    parser.add_argument("--max-size", type=int, default=1 << 20, help="Largest file in bytes")
+    parser.add_argument("--history", type=int, default=10, help="Commits of history to build")
+    parser.add_argument("--churn", type=int, default=10, help="Files edited per commit")
+    parser.add_argument("--runs", type=int, default=5, help="Samples per end-to-end command")
+    parser.add_argument("--iterations", type=int, default=200, help="Samples per microbenchmark")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the microbenchmarks")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    shape = Shape(args.files, args.depth, args.width, args.median_size, args.size_sigma,
+                  args.max_size, args.history, args.churn, args.seed)
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="vctrl-bench-")
+    cwd = os.getcwd()
+    results = []
+    try:
+        paths, total_bytes = write_tree_files(workdir, shape)
+        print(f"{len(paths)} files, {total_bytes / 1e6:.1f} MB in {len(shape.leaf_dirs())} directories")
+        if not args.skip_e2e:
+            results.extend(initial_suite(workdir, shape, total_bytes, args.runs))
+        first, last = build_history(workdir, shape, paths, rng)
+        if not args.skip_e2e:
+            results.extend(history_suite(workdir, shape, paths, rng, first, last, args.runs))
+
+        os.chdir(workdir)
+        with Repository(os.path.join(workdir, REPO_DIR)), contextlib.redirect_stdout(io.StringIO()):
+            results.extend(micro_suite(workdir, args.iterations, rng))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    print(f"{'benchmark':<24} {'p50 (ms)':>10} {'p99 (ms)':>10} {'throughput':>18} {'peak RSS':>10}")
+    for name, result in results:
+        throughput = (f"{result['throughput']:.1f} {result['throughput_unit']}"
+                      if result.get("throughput") else "")
+        rss = f"{result['peak_rss_kb'] / 1024:.0f} MB" if "peak_rss_kb" in result else ""
+        print(f"{name:<24} {result['p50'] * 1000:>10.2f} {result['p99'] * 1000:>10.2f} "
+              f"{throughput:>18} {rss:>10}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "shape": shape.as_dict(),
+                "runs": args.runs,
+                "iterations": args.iterations,
+                "harness_peak_rss_kb": self_peak_rss_kb(),
+            },
+            "results": dict(results),
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark tree parsing: binary (v2) trees against legacy text (v1) trees.
+
+    python benchmarks/bench_tree_parse.py --entries 10000
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from vctrl.objects import Tree, parse_tree  # noqa: E402
+
+
+def make_entries(count):
+    entries = []
+    for i in range(count):
+        type_ = "tree" if i % 10 == 0 else "blob"
+        oid = hashlib.sha1(str(i).encode()).hexdigest()
+        entries.append((type_, oid, f"entry_{i:06d}.py"))
+    return entries
+
+
+def best_of(func, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries)
+    binary = Tree(entries=entries).data
+    text = "\n".join(f"{type_} {oid} {name}" for type_, oid, name in entries).encode()
+    assert [(e.type, e.oid, e.name) for e in parse_tree(binary)] == entries
+    assert [(e.type, e.oid, e.name) for e in parse_tree(text)] == entries
+
+    print(f"{args.entries} entries, best of {args.repeat}")
+    print(f"{'format':>8} {'bytes':>10} {'ms/tree':>10} {'entries/s':>12}")
+    for name, data in (("binary", binary), ("text", text)):
+        elapsed = best_of(parse_tree, data, args.repeat)
+        print(f"{name:>8} {len(data):>10} {elapsed * 1e3:>10.2f} {args.entries / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
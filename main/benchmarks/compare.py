@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files and flag regressions.
+
+Reads the JSON written by `bench_suite.py --output` for a baseline and a
+candidate run and prints, for every benchmark both ran, the chosen latency
+percentile and peak RSS side by side. A benchmark regresses when it got
+slower by more than --threshold (relative) and --min-delta-ms (absolute,
+to ignore noise on sub-millisecond operations), or when its peak RSS grew
+by more than --rss-threshold. Exits with status 1 if anything regressed.
+
+    python benchmarks/compare.py before.json after.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base, new, metric, threshold, min_delta, rss_threshold):
+    rows = []
+    for name in base["results"]:
+        if name not in new["results"]:
+            continue
+        old_result, new_result = base["results"][name], new["results"][name]
+        old_time, new_time = old_result[metric], new_result[metric]
+        change = (new_time - old_time) / old_time if old_time else 0.0
+        flags = []
+        if change > threshold and new_time - old_time > min_delta:
+            flags.append("SLOWER")
+        elif change < -threshold and old_time - new_time > min_delta:
+            flags.append("faster")
+
+        old_rss, new_rss = old_result.get("peak_rss_kb"), new_result.get("peak_rss_kb")
+        rss_change = None
+        if old_rss and new_rss:
+            rss_change = (new_rss - old_rss) / old_rss
+            if rss_change > rss_threshold:
+                flags.append("MORE MEMORY")
+        rows.append((name, old_time, new_time, change, rss_change, flags))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base", help="Baseline results (JSON)")
+    parser.add_argument("new", help="Candidate results (JSON)")
+    parser.add_argument("--metric", default="p50", choices=["p50", "p99", "mean", "min"])
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Ignore differences smaller than this")
+    parser.add_argument("--rss-threshold", type=float, default=0.10,
+                        help="Relative peak RSS growth that counts as a regression")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    for label, report in (("base", base), ("new", new)):
+        meta = report.get("meta", {})
+        print(f"{label}: revision {meta.get('revision')} on {meta.get('platform')}, "
+              f"{meta.get('cpus')} CPUs")
+    if base.get("meta", {}).get("shape") != new.get("meta", {}).get("shape"):
+        print("⚠️  The runs used different repository shapes; timings are not comparable")
+
+    rows = compare(base, new, args.metric, args.threshold, args.min_delta_ms / 1000,
+                   args.rss_threshold)
+    print(f"\n{'benchmark':<24} {'base (ms)':>10} {'new (ms)':>10} {'change':>8} {'RSS':>8}  ")
+    regressions = 0
+    for name, old_time, new_time, change, rss_change, flags in rows:
+        rss = f"{rss_change:+.0%}" if rss_change is not None else ""
+        print(f"{name:<24} {old_time * 1000:>10.2f} {new_time * 1000:>10.2f} {change:>+8.1%} "
+              f"{rss:>8}  {' '.join(flags)}")
+        regressions += any(flag.isupper() for flag in flags)
+
+    missing = sorted(base["results"].keys() ^ new["results"].keys())
+    if missing:
+        print(f"\nOnly in one run: {', '.join(missing)}")
+    if regressions:
+        print(f"\n❌ {regressions} regression(s) beyond {args.threshold:.0%} ({args.metric})")
+        sys.exit(1)
+    print(f"\n✅ No regressions beyond {args.threshold:.0%} ({args.metric})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Shared pieces of the benchmark suite: synthetic repository shapes, timing
+statistics and peak memory.
+"""
+
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+# What a synthetic repository looks like. Files are spread round-robin over
+# width ** depth leaf directories; sizes follow a log-normal distribution
+# around `median_size`, capped at `max_size` (mostly small files with a
+# long tail of large ones, as in source trees). `history` commits each
+# edit `churn` files.
+class Shape:
+
+    def __init__(self, files=2000, depth=3, width=4, median_size=2048,
+                 size_sigma=1.0, max_size=1 << 20, history=10, churn=10, seed=1):
+        self.files = files
+        self.depth = depth
+        self.width = width
+        self.median_size = median_size
+        self.size_sigma = size_sigma
+        self.max_size = max_size
+        self.history = history
+        self.churn = churn
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def leaf_dirs(self):
+        dirs = [""]
+        for _ in range(self.depth):
+            dirs = [f"{parent}d{i}/" for parent in dirs for i in range(self.width)]
+        return dirs
+
+    def paths(self):
+        dirs = self.leaf_dirs()
+        return [f"{dirs[i % len(dirs)]}file_{i:06d}.txt" for i in range(self.files)]
+
+    def size(self, rng):
+        size = rng.lognormvariate(math.log(self.median_size), self.size_sigma)
+        return max(1, min(self.max_size, int(size)))
+
+
+# Text-like content: lines of hex, so line diffs and merges have real work
+def make_content(rng, size):
+    data = rng.randbytes((size + 1) // 2).hex()
+    return "\n".join(data[i:i + 63] for i in range(0, len(data), 63)).encode()[:size] + b"\n"
+
+
+def write_tree_files(root, shape):
+    rng = random.Random(shape.seed)
+    paths = shape.paths()
+    total = 0
+    for rel_path in paths:
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = make_content(rng, shape.size(rng))
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+    return paths, total
+
+
+# Rewrite one line in the middle of each of `count` files, so diffs stay
+# small and edits in different files merge cleanly
+def touch_files(root, paths, count, rng, tag=""):
+    chosen = rng.sample(paths, min(count, len(paths)))
+    for rel_path in chosen:
+        path = os.path.join(root, rel_path)
+        with open(path, "rb") as f:
+            lines = f.read().split(b"\n")
+        lines[len(lines) // 2] = f"edited {tag} {rng.random()}".encode()
+        with open(path, "wb") as f:
+            f.write(b"\n".join(lines))
+    return chosen
+
+
+def cli_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.abspath(ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    env["VCTRL_NO_DAEMON"] = "1"
+    return env
+
+
+# Run `vctrl <args>` as its own process. Returns (seconds, peak RSS in KiB).
+def run_cli(args, cwd, env=None, check=True):
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "vctrl.cli", *args], cwd=cwd,
+                            env=env or cli_env(), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    stderr = proc.stderr.read().decode(errors="replace")
+    proc.stderr.close()
+    if check and proc.returncode != 0:
+        raise RuntimeError(f"vctrl {' '.join(args)} failed ({proc.returncode}):\n{stderr}")
+    return elapsed, usage.ru_maxrss
+
+
+def percentile(sorted_samples, fraction):
+    # Nearest rank, so p99 of a handful of samples is their maximum
+    rank = max(1, math.ceil(fraction * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+# Summarise timings in seconds. `work` is how much each sample processed, in
+# `work_unit`s, for a throughput figure.
+def summarize(samples, work=None, work_unit=None, peak_rss_kb=None):
+    ordered = sorted(samples)
+    result = {
+        "unit": "s",
+        "samples": len(ordered),
+        "min": ordered[0],
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1],
+    }
+    if work:
+        result["throughput"] = work / result["p50"] if result["p50"] else None
+        result["throughput_unit"] = f"{work_unit}/s"
+    if peak_rss_kb is not None:
+        result["peak_rss_kb"] = peak_rss_kb
+    return result
+
+
+def self_peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -62,7 +62,103 @@ vctrl commit -m "Conflicting change on main"
 # Now merge to cause conflict
 vctrl merge main feature
 
+# Resolve it; the commit records both parents
+echo "resolved" > test.txt
+vctrl add test.txt
+vctrl commit -m "Resolve conflict"
+echo "🧪 Merging again (expect already up to date)"
+vctrl merge main feature
+
 vctrl status
+echo "untracked" > notes.txt
+echo "edited" >> test.txt
+vctrl status --porcelain
+rm notes.txt
+vctrl add test.txt
+vctrl commit -m "Edit after merge"
+
+# Tracing: a summary table on stderr, or a Chrome trace-event file
+vctrl --trace status > trace.out 2> trace.err
+if ! grep -q "^span" trace.err || grep -q "^span" trace.out; then
+    echo "❌ Trace summary did not go to stderr"
+    exit 1
+fi
+VCTRL_TRACE=trace.json vctrl log --oneline > /dev/null
+python3 -c "import json; assert json.load(open('trace.json'))['traceEvents']"
+rm trace.out trace.err trace.json
+
+# Pack everything and make sure packed objects are still readable
+vctrl gc
+vctrl log --oneline
+
+# A staged draft that was replaced is unreachable; prune it right away,
+# along with the conflict-marker blob the merge staged (gc left it loose)
+cp test.txt test.txt.orig
+echo "draft" >> test.txt
+vctrl add test.txt
+mv test.txt.orig test.txt
+vctrl add test.txt
+if ! vctrl gc --prune 0 | grep "Pruned 2 unreachable"; then
+    echo "❌ Unreachable draft was not pruned"
+    exit 1
+fi
+vctrl log --oneline
+
+# A draft that became unreachable after it was packed is left out of the
+# next pack and keeps the pack's age, so a later prune still removes it
+cp test.txt test.txt.orig
+echo "packed draft" >> test.txt
+vctrl add test.txt
+vctrl gc
+mv test.txt.orig test.txt
+vctrl add test.txt
+touch -d "30 days ago" .vctrl/objects/pack/*.pack
+vctrl gc
+if ! vctrl gc --prune | grep "Pruned 1 unreachable"; then
+    echo "❌ Aged unreachable draft was not pruned"
+    exit 1
+fi
+
+# Refs keep resolving once they live in packed-refs
+vctrl pack-refs
+vctrl branch
+vctrl checkout feature
+vctrl diff
+
+# Ignored paths are never walked or added
+mkdir -p build && echo junk > build/out.bin
+echo "*.log" > .vctrlignore
+echo noise > debug.log
+if vctrl add . | grep -E "build/|debug.log"; then
+    echo "❌ Ignored files were added"
+    exit 1
+fi
+echo "✅ Ignored files skipped"
+
+# The same commands answer through a running daemon
+# (its file system monitor must notice edits made while it runs,
+# including to a tracked file inside an ignored directory)
+vctrl add build/out.bin
+vctrl daemon start --detach
+vctrl status --porcelain > /dev/null
+echo "watched" >> test.txt
+echo "rebuilt" >> build/out.bin
+mkdir -p watched/dir
+echo "new" > watched/dir/file.txt
+DIRECT=$(VCTRL_NO_DAEMON=1 vctrl status --porcelain)
+VIA_DAEMON=$(vctrl status --porcelain)
+vctrl daemon stop
+if [ "$DIRECT" != "$VIA_DAEMON" ]; then
+    echo "❌ Daemon status differs from in-process status"
+    echo "$DIRECT"
+    echo "$VIA_DAEMON"
+    exit 1
+fi
+if ! echo "$VIA_DAEMON" | grep -q "^.M build/out.bin$"; then
+    echo "❌ Edit to a tracked ignored file was missed"
+    exit 1
+fi
+echo "✅ Daemon matches in-process output"
 
 # Done
 echo "✅ All tests completed"
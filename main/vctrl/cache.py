@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 << 20
+_UNITS = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+
+
+# Parse a size such as "65536", "512k" or "64M"
+def parse_size(value):
+    value = value.strip().lower().rstrip("b")
+    if value and value[-1] in _UNITS:
+        return int(float(value[:-1]) * _UNITS[value[-1]])
+    return int(value)
+
+
+def configured_max_bytes():
+    value = os.environ.get("VCTRL_OBJECT_CACHE_BYTES")
+    if not value:
+        return DEFAULT_MAX_BYTES
+    try:
+        return parse_size(value)
+    except ValueError:
+        raise ValueError(f"Invalid VCTRL_OBJECT_CACHE_BYTES: {value!r}")
+
+
+# In-process LRU cache with a byte budget. Objects are addressed by content,
+# so entries never go stale; they are only evicted to stay within budget.
+class ObjectCache:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, cost)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, cost):
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, cost)
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, (_, evicted_cost) = self._entries.popitem(last=False)
+                self.size -= evicted_cost
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+object_cache = ObjectCache(configured_max_bytes())
@@ -1,49 +1,52 @@
 #!/usr/bin/env python3
 
-import argparse, os, json, sys
-from vctrl.commands.branch import create_branch, list_branches
+import os, sys
+
+# Command modules are imported inside the handlers, so starting up costs
+# only the modules the command actually uses
 
 def status(args):
-    from vctrl.refs import get_ref, get_branch_name
-    branch = get_branch_name()
-    if branch:
-        print(f"📍 You are on branch: {branch}")
-    else:
-        commit_oid = get_ref("HEAD")
-        print(f"📍 HEAD detached at {commit_oid[:7]}")
+    from vctrl.commands.status import status
+    try:
+        status(porcelain=args.porcelain)
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 def add(args):
-    from vctrl.objects import hash_object
-    from vctrl.index import add_to_index
-
-    def process_file(path):
-        with open(path, 'rb') as f:
-            data = f.read()
-        oid = hash_object(data, type_="blob")
-        rel_path = os.path.relpath(path, os.getcwd())
-        add_to_index(rel_path, oid)
-        print(f"Added {rel_path} ({oid[:7]})")
+    from vctrl.index import add_many
 
+    paths = []
+    stats = None
+    fsmonitor = None
     if args.path == ".":
-        for root, dirs, files in os.walk(os.getcwd()):
-            if '.vctrl' in root:
-                continue
-            for fname in files:
-                full_path = os.path.join(root, fname)
-                if ".vctrl" in full_path:
-                    continue
-                process_file(full_path)
+        from vctrl.index import load_index, load_fsmonitor_state, FsmonitorState
+        from vctrl.worktree import changed_files
+        entries = load_index()[0]
+        token, found, complete = changed_files(entries, load_fsmonitor_state())
+        present = sorted((path, st) for path, st in found.items() if st is not None)
+        paths = [path for path, _ in present]
+        stats = [st for _, st in present]
+        if token:
+            # Everything present is staged now; only vanished files stay dirty
+            if complete:
+                gone = [path for path in entries if path not in found]
+            else:
+                gone = [path for path, st in found.items() if st is None]
+            fsmonitor = FsmonitorState(token, dirty=gone)
     else:
         full_path = os.path.join(os.getcwd(), args.path)
         if os.path.isfile(full_path):
-            process_file(full_path)
+            paths.append(full_path)
         else:
             print(f"File not found: {args.path}")
+            return
+
+    for rel_path, oid in add_many(paths, jobs=args.jobs, stats=stats, fsmonitor=fsmonitor):
+        print(f"Added {rel_path} ({oid[:7]})")
 
 def commit(args):
-    from vctrl.objects import Commit, write_tree
-    from vctrl.refs import get_ref, update_ref
-    from vctrl.objects import get_object
+    from vctrl.objects import Commit, write_tree, read_commit
+    from vctrl.refs import get_ref, read_ref, update_ref
     from vctrl.repo import repo_path
 
     message = args.message.strip()
@@ -57,40 +60,41 @@ def commit(args):
         return
 
     parent = get_ref("HEAD")
-    if parent:
-        parent_commit = get_object(parent, expected_type="commit").decode()
-        for line in parent_commit.splitlines():
-            if line.startswith("tree "):
-                parent_tree_oid = line.split()[1]
-                if parent_tree_oid == tree_oid:
-                    print("No changes since last commit.")
-                    return
-                break
+    # A merge that stopped on conflicts left its other side in MERGE_HEAD
+    merge_head = os.path.join(repo_path(), "MERGE_HEAD")
+    parents = [parent] if parent else []
+    if os.path.exists(merge_head):
+        with open(merge_head) as f:
+            parents.append(f.read().strip())
+    elif parent and read_commit(parent).tree == tree_oid:
+        print("No changes since last commit.")
+        return
 
     author_name = os.environ.get("GIT_AUTHOR_NAME", "you")
     author_email = os.environ.get("GIT_AUTHOR_EMAIL", "notknown")
 
-    commit_obj = Commit(tree_oid=tree_oid, parent=parent,
+    commit_obj = Commit(tree_oid=tree_oid, parents=parents,
                         message=message,
                         author_name=author_name,
                         author_email=author_email)
     oid = commit_obj.save()
 
-    head = os.path.join(repo_path(), "HEAD")
-    with open(head) as f:
-        ref = f.read().strip()
+    ref = read_ref("HEAD")
     if ref.startswith("ref:"):
-        update_ref(ref[5:], oid)
+        update_ref(ref[4:].strip(), oid)
     else:
         update_ref("HEAD", oid)
+    if os.path.exists(merge_head):
+        os.unlink(merge_head)
     print(f"Committed: {oid[:7]}")
 
 def checkout_branch(args):
     from vctrl.commands.checkout import checkout
-    checkout(args.name)
-    print(f"Checked out {args.name}")
+    if checkout(args.name):
+        print(f"Checked out {args.name}")
 
 def handle_branch(args):
+    from vctrl.commands.branch import create_branch, list_branches
     if args.name and args.create:
         create_branch(args.name)
         print(f"Created branch {args.name}")
@@ -101,23 +105,88 @@ def handle_branch(args):
         list_branches()
 
 def diff(args):
-    from vctrl.commands.diff import diff_index_vs_workdir
-    diff_index_vs_workdir()
-    print("Diff complete")
+    if not args.commits:
+        from vctrl.commands.diff import diff_index_vs_workdir
+        diff_index_vs_workdir(show_patch=args.patch)
+        print("Diff complete")
+        return
+
+    from vctrl.refs import resolve_commit
+    from vctrl.commands.diff import print_commit_diff
+    if len(args.commits) != 2:
+        print("Usage: vctrl diff [<commit> <commit>]")
+        sys.exit(1)
+    oids = []
+    for name in args.commits:
+        oid = resolve_commit(name)
+        if not oid:
+            print(f"❌ Branch or commit '{name}' not found.")
+            sys.exit(1)
+        oids.append(oid)
+    print_commit_diff(*oids, name_status=args.name_status)
 
 def merge_command(args):
-    from vctrl.refs import get_ref
-    base_oid = get_ref(f"refs/heads/{args.base}")
-    other_oid = get_ref(f"refs/heads/{args.other}")
-    from vctrl.commands.merge import merge
-    merge(base_oid, other_oid)
+    from vctrl.commands.merge import merge_branches
+    merge_branches(args.base, args.other)
+
+def gc_command(args):
+    from vctrl.commands.gc import gc, PRUNE_GRACE
+    gc(prune_grace=PRUNE_GRACE if args.prune is True else args.prune)
+
+def log_command(args):
+    from vctrl.refs import resolve_commit
+    from vctrl.commands.log import log
+    tips = []
+    for name in args.revisions or ["HEAD"]:
+        oid = resolve_commit(name)
+        if not oid:
+            print(f"❌ Branch or commit '{name}' not found.")
+            sys.exit(1)
+        tips.append(oid)
+    try:
+        log(tips, max_count=args.max_count, oneline=args.oneline)
+    except BrokenPipeError:
+        # Output piped into something like `head` that stopped reading
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+def commit_graph_command(args):
+    from vctrl.commitgraph import write_commit_graph
+    path, count = write_commit_graph()
+    print(f"📈 Wrote commit graph with {count} commits")
+
+def pack_refs_command(args):
+    from vctrl.refs import pack_refs
+    count = pack_refs()
+    print(f"📦 Packed {count} refs")
+
+def daemon_command(args):
+    from vctrl.daemon import serve, spawn_daemon, stop_daemon, daemon_running, socket_path
+    if args.action == "start" and args.detach:
+        if daemon_running():
+            print("✅ Daemon already running")
+        elif spawn_daemon():
+            print(f"🚀 Daemon listening on {socket_path()}")
+        else:
+            print("❌ Daemon did not start")
+            sys.exit(1)
+    elif args.action == "start":
+        serve()
+    elif args.action == "stop":
+        print("🛑 Daemon stopped" if stop_daemon() else "No daemon running")
+    else:
+        print("✅ Daemon running" if daemon_running() else "No daemon running")
 
 def init(args):
     from vctrl.repo import init
     path = init(args.path)
 
 def build_parser():
+    import argparse
     parser = argparse.ArgumentParser(prog='vctrl', description="Git-like version control tool")
+    parser.add_argument("--trace", action="store_true",
+                        help="Print a table of timed phases and counters to stderr")
+    parser.add_argument("--trace-file", metavar="FILE",
+                        help="Write a Chrome trace-event file (chrome://tracing, Perfetto)")
     subparsers = parser.add_subparsers(title='subcommands', dest='command')
 
     subparsers.add_parser("init", help="Initialize a repo").add_argument("path", nargs='?', default=os.getcwd())
@@ -125,6 +194,8 @@ def build_parser():
 
     add_parser = subparsers.add_parser("add", help="Add a file to index")
     add_parser.add_argument("path")
+    add_parser.add_argument("-j", "--jobs", type=int, default=None,
+                            help="Worker count for hashing (default: CPU count)")
     add_parser.set_defaults(func=add)
 
     commit_parser = subparsers.add_parser("commit", help="Commit changes")
@@ -140,10 +211,17 @@ def build_parser():
     branch_parser.add_argument("-b", "--create", action="store_true", help="Create new branch")
     branch_parser.set_defaults(func=handle_branch)
 
-    status_parser = subparsers.add_parser("status", help="Show current branch")
+    status_parser = subparsers.add_parser("status", help="Show staged, unstaged and untracked changes")
+    status_parser.add_argument("--porcelain", action="store_true",
+                               help="Stable \"XY path\" output for scripts")
     status_parser.set_defaults(func=status)
 
     diff_parser = subparsers.add_parser("diff", help="Show diff")
+    diff_parser.add_argument("commits", nargs="*", help="Two commits or branches to compare")
+    diff_parser.add_argument("-p", "--patch", action="store_true",
+                             help="Show line changes for modified working-tree files")
+    diff_parser.add_argument("--name-status", action="store_true",
+                             help="Only list changed paths when comparing commits")
     diff_parser.set_defaults(func=diff)
 
     merge_parser = subparsers.add_parser("merge", help="Merge branches")
@@ -151,17 +229,72 @@ def build_parser():
     merge_parser.add_argument("other")
     merge_parser.set_defaults(func=merge_command)
 
+    log_parser = subparsers.add_parser("log", help="Show commit history")
+    log_parser.add_argument("revisions", nargs="*", help="Branches or commits to start from (default: HEAD)")
+    log_parser.add_argument("-n", "--max-count", type=int, default=None)
+    log_parser.add_argument("--oneline", action="store_true", help="One line per commit")
+    log_parser.set_defaults(func=log_command)
+
+    graph_parser = subparsers.add_parser("commit-graph", help="Write the commit-graph file")
+    graph_parser.add_argument("action", choices=["write"])
+    graph_parser.set_defaults(func=commit_graph_command)
+
+    pack_refs_parser = subparsers.add_parser("pack-refs", help="Move branch refs into packed-refs")
+    pack_refs_parser.set_defaults(func=pack_refs_command)
+
+    for name in ("gc", "repack"):
+        gc_parser = subparsers.add_parser(name, help="Pack loose objects into a packfile")
+        gc_parser.add_argument("--prune", nargs="?", type=int, const=True, metavar="SECONDS",
+                               help="First delete unreachable loose objects older than SECONDS "
+                                    "(default: two weeks)")
+        gc_parser.set_defaults(func=gc_command)
+
+    daemon_parser = subparsers.add_parser("daemon", help="Serve commands from a warm background process")
+    daemon_parser.add_argument("action", nargs="?", default="start", choices=["start", "stop", "status"])
+    daemon_parser.add_argument("--detach", action="store_true", help="Start in the background")
+    daemon_parser.set_defaults(func=daemon_command)
+
     return parser
 
-def main():
+# Commands that never go through the daemon
+IN_PROCESS_COMMANDS = {"init", "daemon", "-h", "--help"}
+
+def run(argv=None):
     parser = build_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    if hasattr(args, 'func'):
-        args.func(args)
-    else:
+    if not hasattr(args, 'func'):
         parser.print_help()
         sys.exit(1)
 
+    from vctrl import trace
+    trace.start(args.trace_file or ("1" if args.trace else None))
+    try:
+        with trace.span(f"vctrl {args.command}"):
+            args.func(args)
+    finally:
+        trace.finish()
+
+# The subcommand in `argv`, skipping the global options before it
+def _command_name(argv):
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--trace-file":
+            skip = True
+        elif not arg.startswith("--trace"):
+            return arg
+    return None
+
+def main():
+    argv = sys.argv[1:]
+    if argv and _command_name(argv) not in IN_PROCESS_COMMANDS:
+        from vctrl.daemon import forward
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+    run(argv)
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,4 @@
-import os
-from vctrl.refs import update_ref, get_ref
-from vctrl.repo import repo_path
+from vctrl.refs import update_ref, get_ref, list_refs
 
 
 def create_branch(name, start_oid=None):
@@ -18,7 +16,5 @@ def create_branch(name, start_oid=None):
 
 
 def list_branches():
-    refs_dir = os.path.join(repo_path(), "refs/heads")
-    branches = os.listdir(refs_dir)
-    for branch in branches:
-        print(branch)
+    for ref, _ in list_refs("refs/heads/"):
+        print(ref[len("refs/heads/"):])
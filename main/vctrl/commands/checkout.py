@@ -1,55 +1,150 @@
 import os
-from vctrl.index import clear_index, write_index
-from vctrl.refs import get_ref
-from vctrl.objects import GitObject, Blob
-from vctrl.repo import repo_path
+from concurrent.futures import ThreadPoolExecutor
+from vctrl.index import load_index, write_index, IndexEntry
+from vctrl.refs import get_ref, update_ref, update_symbolic_ref
+from vctrl.objects import read_commit, flatten_tree, open_object, object_exists, hash_file
+from vctrl.repo import repo_path, current_repository
+from vctrl.trace import span, traced
+
+# Blob reads and file writes are mostly zlib and I/O, which release the GIL
+CHECKOUT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
 
 def checkout(name):
     # Get OID: could be direct commit or symbolic ref
-    try:
-        oid = get_ref(f"refs/heads/{name}")  # Try as branch
-    except FileNotFoundError:
+    oid = get_ref(f"refs/heads/{name}")  # Try as branch
+    is_branch = oid is not None
+    if not is_branch and object_exists(name):
         oid = name  # Fallback to raw OID
 
     if oid is None or not isinstance(oid, str) or not oid.strip():
         print(f"❌ Branch or commit '{name}' not found.")
-        return
+        return False
 
     try:
-        commit = GitObject.from_file(oid, expected_type="commit")
+        tree_oid = read_commit(oid).tree
     except FileNotFoundError:
         print(f"❌ Commit object '{oid}' not found in object store.")
-        return
-
-    tree_oid = commit.data.decode().split("\n")[0].split()[1]
+        return False
 
     # Replace working directory with tree contents
-    checkout_tree(tree_oid)
+    if not checkout_tree(tree_oid):
+        return False
 
-    # Update HEAD
-    with open(os.path.join(repo_path(), "HEAD"), "w") as f:
-        f.write(f"ref: refs/heads/{name}")
+    # Update HEAD; switching away abandons any merge in progress
+    if is_branch:
+        update_symbolic_ref("HEAD", f"refs/heads/{name}")
+    else:
+        update_ref("HEAD", oid)
+    merge_head = os.path.join(repo_path(), "MERGE_HEAD")
+    if os.path.exists(merge_head):
+        os.unlink(merge_head)
+    return True
 
-    clear_index()
 
+# The tree the working directory currently matches, with its cache tree:
+# the index, or HEAD's tree for repositories whose index was cleared by an
+# older checkout.
+def current_entries():
+    entries, cache_tree = load_index()
+    if entries:
+        return entries, cache_tree
+    head = get_ref("HEAD")
+    if not head:
+        return {}, {}
+    return {path: IndexEntry(oid) for path, oid in flatten_tree(read_commit(head).tree).items()}, {}
 
 
-def checkout_tree(tree_oid):
-    tree = GitObject.from_file(tree_oid, expected_type="tree")
-    entries = tree.data.decode().splitlines()
-    for entry in entries:
-        parts = entry.split()
-        if len(parts) != 3:
-            raise ValueError(f"Malformed tree entry: {entry}")
-
-        type_, oid, path = parts
+# A file is in the way if it differs from both what the index recorded and
+# what the checkout is about to write there
+def _is_dirty(path, entry, target_oid):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if entry is not None and entry.matches(st):
+        return False
+    return hash_file(path, write=False) not in (entry and entry.oid, target_oid)
+
+
+# Written to a temp file and renamed into place. The temp file is created
+# with mode 0666 like any other new file, so the umask applies (mkstemp
+# would leave every checked-out file 0600).
+def _write_blob(path, oid):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".vctrl-tmp-{os.urandom(6).hex()}")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as out, open_object(oid, expected_type="blob") as blob:
+            for chunk in blob:
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return os.stat(path)
+
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return
+    directory = os.path.dirname(path)
+    while directory:
         try:
-            blob = GitObject.from_file(oid, expected_type="blob")
-        except FileNotFoundError:
-            print(f"⚠️ Warning: Missing blob object for {path} ({oid})")
-        continue
-
-        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-        with open(path, "wb") as f:
-            f.write(blob.data)
+            os.rmdir(directory)
+        except OSError:
+            break  # not empty
+        directory = os.path.dirname(directory)
+
+
+# Move the working directory and index from their current state to
+# `tree_oid`. Only files whose oid differs are touched.
+def checkout_tree(tree_oid):
+    current, _ = current_entries()
+    cache_tree = {}
+    with span("checkout.read_tree"):
+        target = flatten_tree(tree_oid, dirs=cache_tree)
+
+    changes = {path: oid for path, oid in target.items()
+               if path not in current or current[path].oid != oid}
+    changes.update((path, None) for path in current if path not in target)
+    return apply_changes(current, changes, cache_tree)
+
+
+# Apply `changes` ({path: blob oid, or None to delete}) to the working
+# directory and to the `current` index entries. Changed and new files are
+# inflated on a thread pool and renamed into place, removed files are
+# deleted, and everything else keeps its index entry (and stat data) as
+# is. Nothing is touched if a local modification would be lost.
+@traced("checkout.apply")
+def apply_changes(current, changes, cache_tree, action="checkout"):
+    to_write = [path for path, oid in changes.items()
+                if oid is not None and (path not in current or current[path].oid != oid)]
+    to_delete = [path for path, oid in changes.items() if oid is None and path in current]
+
+    with span("checkout.check_dirty"):
+        overwritten = [path for path in to_write + to_delete
+                       if _is_dirty(path, current.get(path), changes[path])]
+    if overwritten:
+        print(f"❌ Your local changes would be overwritten by {action}:")
+        for path in sorted(overwritten):
+            print(f"  - {path}")
+        return False
+
+    for path in to_delete:
+        _remove_file(path)
+
+    touched = set(to_write) | set(to_delete)
+    entries = {path: entry for path, entry in current.items() if path not in touched}
+    repo = current_repository()  # pool threads don't see the caller's `with repo:`
+    with span("checkout.write_files"), ThreadPoolExecutor(max_workers=CHECKOUT_WORKERS) as pool:
+        stats = pool.map(lambda path: repo._call(_write_blob, path, changes[path]), to_write)
+        for path, st in zip(to_write, stats):
+            entries[path] = IndexEntry.from_stat(changes[path], st)
+
+    write_index(entries, cache_tree)
+    return True
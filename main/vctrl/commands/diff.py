@@ -1,40 +1,110 @@
-from vctrl.index import read_index
-from vctrl.objects import GitObject
+import sys
+from vctrl.objects import get_object, read_tree, read_commit, flatten_tree, is_flat_tree
+from vctrl.linediff import unified_diff
 
 
-import os
+# Yield (status, path, old_oid, new_oid) for every file that differs between
+# two trees. Entries with the same oid on both sides, subtrees included,
+# are skipped without being read, so the cost follows the size of the
+# change rather than the size of the trees.
+def diff_trees(old_tree, new_tree, prefix=""):
+    if old_tree == new_tree:
+        return
+    old_entries = read_tree(old_tree) if old_tree else ()
+    new_entries = read_tree(new_tree) if new_tree else ()
+    if is_flat_tree(old_entries) or is_flat_tree(new_entries):
+        yield from _diff_flat(old_tree, new_tree, prefix)
+        return
+    old = {entry.name: entry for entry in old_entries}
+    new = {entry.name: entry for entry in new_entries}
 
+    for name in sorted(old.keys() | new.keys()):
+        old_entry, new_entry = old.get(name), new.get(name)
+        if old_entry and new_entry and old_entry.oid == new_entry.oid:
+            continue
+        path = prefix + name
 
-IGNORED_DIRS = {'.vctrl', '__pycache__', '.git', '.DS_Store', 'venv', 'build', 'dist'}
+        old_is_tree = old_entry is not None and old_entry.type == "tree"
+        new_is_tree = new_entry is not None and new_entry.type == "tree"
+        if old_is_tree or new_is_tree:
+            yield from diff_trees(old_entry.oid if old_is_tree else None,
+                                  new_entry.oid if new_is_tree else None,
+                                  path + "/")
 
+        old_blob = old_entry.oid if old_entry and not old_is_tree else None
+        new_blob = new_entry.oid if new_entry and not new_is_tree else None
+        if old_blob and new_blob:
+            yield "M", path, old_blob, new_blob
+        elif old_blob:
+            yield "D", path, old_blob, None
+        elif new_blob:
+            yield "A", path, None, new_blob
 
-def is_ignored(path):
-    parts = path.split(os.sep)
-    return any(part in IGNORED_DIRS for part in parts)
 
+# diff_trees when either side is a flat (legacy) tree: compare whole paths
+def _diff_flat(old_tree, new_tree, prefix):
+    old = flatten_tree(old_tree) if old_tree else {}
+    new = flatten_tree(new_tree) if new_tree else {}
+    for path in sorted(old.keys() | new.keys()):
+        old_blob, new_blob = old.get(path), new.get(path)
+        if old_blob and new_blob:
+            if old_blob != new_blob:
+                yield "M", prefix + path, old_blob, new_blob
+        elif old_blob:
+            yield "D", prefix + path, old_blob, None
+        else:
+            yield "A", prefix + path, None, new_blob
 
-def diff_index_vs_workdir():
-    index_data = read_index()
-    seen_paths = set()
 
-    # 1. Check for modified & deleted files
-    for path, oid in index_data.items():
-        seen_paths.add(path)
-        try:
-            with open(path, 'rb') as f:
-                data = f.read()
-            current_oid = GitObject(data=data, type_="blob").save()
-            if current_oid != oid:
-                print(f"Modified: {path}")
-        except FileNotFoundError:
+def diff_commits(old_commit, new_commit):
+    return diff_trees(read_commit(old_commit).tree, read_commit(new_commit).tree)
+
+
+def _lines(data):
+    return data.decode("utf-8", "surrogateescape").splitlines(keepends=True)
+
+
+# Unified diff for one file; either side may be missing (None)
+def patch(path, old_data, new_data):
+    yield f"diff --vctrl a/{path} b/{path}\n"
+    if b"\0" in (old_data or b"")[:8000] or b"\0" in (new_data or b"")[:8000]:
+        yield f"Binary files a/{path} and b/{path} differ\n"
+        return
+    a_name = f"a/{path}" if old_data is not None else "/dev/null"
+    b_name = f"b/{path}" if new_data is not None else "/dev/null"
+    yield from unified_diff(_lines(old_data or b""), _lines(new_data or b""), a_name, b_name)
+
+
+def _read_blob(oid):
+    return get_object(oid, expected_type="blob") if oid else None
+
+
+def print_commit_diff(old_commit, new_commit, name_status=False):
+    out = sys.stdout
+    for status, path, old_oid, new_oid in diff_commits(old_commit, new_commit):
+        if name_status:
+            out.write(f"{status}\t{path}\n")
+            continue
+        for line in patch(path, _read_blob(old_oid), _read_blob(new_oid)):
+            out.write(line)
+
+
+# Working-tree changes against the index, found the same way as status
+# (stat cache, read-only hashing, file system monitor when running)
+def diff_index_vs_workdir(show_patch=False):
+    from vctrl.commands.checkout import current_entries
+    from vctrl.commands.status import collect_status
+
+    _, unstaged, untracked = collect_status()
+    index_data = current_entries()[0] if show_patch else {}
+    for path, status in sorted(unstaged.items()):
+        if status == "D":
             print(f"Deleted: {path}")
+            continue
+        print(f"Modified: {path}")
+        if show_patch:
+            with open(path, 'rb') as f:
+                sys.stdout.writelines(patch(path, _read_blob(index_data[path].oid), f.read()))
 
-    # 2. Check for added files
-    for root, _, files in os.walk("."):
-        for file in files:
-            full_path = os.path.join(root, file)
-            rel_path = os.path.relpath(full_path, start=".")
-            if is_ignored(rel_path):
-                continue
-            if rel_path not in seen_paths:
-                print(f"Added: {rel_path}")
+    for rel_path in untracked:
+        print(f"Added: {rel_path}")
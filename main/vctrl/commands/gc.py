@@ -0,0 +1,235 @@
+import os
+import time
+import itertools
+from vctrl import pack
+from vctrl.objects import iter_loose_objects, load_object, parse_tree, read_commit, read_tree, object_dir
+from vctrl.objects import encode_object, loose_path, write_object
+from vctrl.index import load_index
+from vctrl.refs import get_ref, list_refs
+from vctrl.commitgraph import write_commit_graph
+from vctrl.trace import count, span, traced
+
+# Order in which object types are written to a pack; commits first so that
+# history walks touch the start of the file
+TYPE_ORDER = {"commit": 0, "tree": 1, "blob": 2}
+# Unreachable loose objects younger than this are kept: a command running
+# right now may have written them and not yet pointed a ref or the index
+# at them (git's default is two weeks as well)
+PRUNE_GRACE = 14 * 24 * 3600
+
+
+def _format_size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def store_size():
+    total = sum(os.path.getsize(path) for _, path in iter_loose_objects())
+    for existing in pack.packs():
+        total += os.path.getsize(existing.pack_path) + os.path.getsize(existing.idx_path)
+    return total
+
+
+def _pack_order(oids):
+    # Pass 1: type, size and a path-name hint for every object. Sorting by
+    # name puts successive versions of the same file next to each other,
+    # which is where the delta window finds its bases.
+    info = {}
+    names = {}
+    for oid in oids:
+        type_, data = load_object(oid)
+        info[oid] = (type_, len(data))
+        if type_ == "tree":
+            for entry in parse_tree(data):
+                names.setdefault(entry.oid, entry.name)
+
+    def sort_key(oid):
+        type_, size = info[oid]
+        name = names.get(oid, "")
+        return (TYPE_ORDER[type_], os.path.basename(name), name, -size)
+
+    return sorted(oids, key=sort_key)
+
+
+# Pack the objects in `reachable` (raw oids, see mark_reachable) into one
+# new pack. Unreachable objects are never packed: the new pack's mtime
+# would restart their grace period on every gc. Loose ones are left as
+# they are; packed ones are written back loose with their pack's mtime,
+# the last time they were written, or dropped if that is before `cutoff`.
+# Returns (pack path, object count, delta count, loose objects removed,
+# packed objects dropped, unreachable objects left loose), or None if
+# there was nothing to pack.
+@traced("gc.repack")
+def repack(reachable, cutoff=None):
+    old_packs = list(pack.packs())
+    loose = dict(iter_loose_objects())
+    oids = {oid for oid in loose if bytes.fromhex(oid) in reachable}
+    unreachable_loose = set(loose) - oids
+    evicted = {}  # oid -> mtime of the youngest pack holding it
+    dropped = set()
+    for existing in old_packs:
+        mtime = os.path.getmtime(existing.pack_path)
+        expired = cutoff is not None and mtime < cutoff
+        for oid in existing.oids():
+            if bytes.fromhex(oid) in reachable:
+                oids.add(oid)
+            elif expired:
+                dropped.add(oid)
+            else:
+                evicted[oid] = max(mtime, evicted.get(oid, mtime))
+    dropped -= unreachable_loose | set(evicted)  # still kept elsewhere
+    if not oids:
+        return None
+
+    ordered = _pack_order(oids)
+    pack_path, count, deltas = pack.write_pack(
+        (oid, *load_object(oid)) for oid in ordered)
+
+    # Unreachable packed objects go back to loose files that keep their
+    # age, before the packs holding them are deleted
+    with span("gc.evict"):
+        for oid, mtime in evicted.items():
+            path = loose_path(oid)
+            if oid in unreachable_loose:
+                mtime = max(mtime, os.path.getmtime(path))
+            else:
+                type_, data = load_object(oid)
+                write_object(*encode_object(data, type_))
+            os.utime(path, (mtime, mtime))
+
+    # Everything else is in the new pack now: drop the old packs and the
+    # reachable loose copies. Loose objects written while we were packing
+    # are left alone.
+    for existing in old_packs:
+        if existing.pack_path == pack_path:
+            continue
+        existing.close()
+        os.unlink(existing.idx_path)
+        os.unlink(existing.pack_path)
+    packed_loose = [loose[oid] for oid in loose if oid not in unreachable_loose]
+    for path in packed_loose:
+        os.unlink(path)
+    for directory in {os.path.dirname(path) for path in packed_loose}:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # not empty: something was written meanwhile
+
+    kept = len(unreachable_loose | set(evicted))
+    return pack_path, count, deltas, len(packed_loose), len(dropped), kept
+
+
+# Raw oids of every object reachable from the refs, HEAD, MERGE_HEAD and the
+# index (entries and cached trees). The walk is depth-first with an explicit
+# stack and reads one commit or tree at a time; only the set of raw 20-byte
+# oids already seen is kept, and a tree seen before (unchanged directories
+# are shared by most commits) is not read again.
+def mark_reachable():
+    seen = set()
+    stack = []  # (oid, type) still to visit
+
+    def push(oid, type_):
+        key = bytes.fromhex(oid)
+        if key not in seen:
+            seen.add(key)
+            if type_ != "blob":
+                stack.append((oid, type_))
+
+    for _, oid in list_refs():
+        push(oid, "commit")
+    for name in ("HEAD", "MERGE_HEAD"):
+        oid = get_ref(name)
+        if oid:
+            push(oid, "commit")
+    entries, cache_tree = load_index()
+    for entry in entries.values():
+        push(entry.oid, "blob")
+    for oid in cache_tree.values():
+        push(oid, "tree")
+
+    while stack:
+        oid, type_ = stack.pop()
+        if type_ == "commit":
+            commit = read_commit(oid)
+            push(commit.tree, "tree")
+            for parent in commit.parents:
+                push(parent, "commit")
+        else:
+            for entry in read_tree(oid):
+                push(entry.oid, entry.type)
+        count("gc.walked")
+    return seen
+
+
+# Delete loose objects that are not reachable and were last written before
+# `cutoff`, along with temp files left by interrupted writes. Returns
+# (objects, bytes) removed.
+@traced("gc.prune")
+def prune_loose(reachable, cutoff):
+    directory = object_dir()
+    temps = [(None, os.path.join(directory, name)) for name in os.listdir(directory)
+             if name.startswith("tmp_obj_")]
+    removed = reclaimed = 0
+    for oid, path in itertools.chain(iter_loose_objects(), temps):
+        if oid is not None and bytes.fromhex(oid) in reachable:
+            continue
+        try:
+            st = os.stat(path)
+            if st.st_mtime >= cutoff:
+                continue
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        removed += oid is not None
+        reclaimed += st.st_size
+        if oid is not None:
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass  # other objects are left in this fan-out dir
+    count("gc.pruned", removed)
+    return removed, reclaimed
+
+
+# Pack every reachable object into one packfile; unreachable ones stay
+# loose. With `prune_grace` (seconds), unreachable objects written longer
+# ago than that are deleted (loose) or not written back (packed).
+def gc(prune_grace=None):
+    size_before = store_size()
+    for existing in pack.packs():
+        try:
+            existing.verify()
+        except ValueError as e:
+            print(f"❌ {e}; nothing was packed.")
+            return
+    try:
+        with span("gc.mark"):
+            reachable = mark_reachable()
+    except FileNotFoundError as e:
+        print(f"❌ Missing object {os.path.basename(e.filename or '')}; nothing was packed.")
+        return
+    cutoff = None
+    if prune_grace is not None:
+        cutoff = time.time() - prune_grace
+        removed, reclaimed = prune_loose(reachable, cutoff)
+        print(f"🗑️  Pruned {removed} unreachable loose objects ({_format_size(reclaimed)})")
+
+    result = repack(reachable, cutoff)
+    if result is None:
+        print("Nothing to pack.")
+        return
+
+    pack_path, count, deltas, removed, dropped, kept = result
+    print(f"📦 Packed {count} objects ({deltas} deltas) into {os.path.basename(pack_path)}")
+    print(f"🧹 Removed {removed} loose objects")
+    if dropped:
+        print(f"🗑️  Dropped {dropped} unreachable packed objects")
+    if kept:
+        print(f"🕒 Left {kept} recent unreachable objects loose")
+    print(f"💾 Object store: {_format_size(size_before)} -> {_format_size(store_size())}")
+    with span("gc.commit_graph"):
+        _, commits = write_commit_graph()
+    print(f"📈 Wrote commit graph with {commits} commits")
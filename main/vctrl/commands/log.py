@@ -0,0 +1,25 @@
+import sys
+import time
+from itertools import islice
+from vctrl.history import walk
+from vctrl.objects import read_commit
+
+
+# Print history from `tips`, newest first. The walk itself runs on the
+# commit graph; commit objects are only read for the lines being printed.
+def log(tips, max_count=None, oneline=False):
+    out = sys.stdout
+    for oid in islice(walk(tips), max_count):
+        info = read_commit(oid)
+        if oneline:
+            subject = info.message.split("\n", 1)[0]
+            out.write(f"{oid[:7]} {subject}\n")
+            continue
+        out.write(f"commit {oid}\n")
+        if len(info.parents) > 1:
+            out.write(f"Merge: {' '.join(parent[:7] for parent in info.parents)}\n")
+        out.write(f"Author: {info.author}\n")
+        out.write(f"Date:   {time.ctime(info.timestamp)}\n\n")
+        for line in info.message.splitlines():
+            out.write(f"    {line}\n")
+        out.write("\n")
@@ -1,59 +1,190 @@
-from vctrl.objects import GitObject, Blob
-from vctrl.index import write_index
-from vctrl.commands.checkout import checkout_tree
+import os
+from vctrl.objects import Blob, Commit, get_object, read_commit, read_tree, flatten_tree, write_tree, is_flat_tree
+from vctrl.index import invalidate_cache_tree
+from vctrl.history import merge_bases, is_ancestor
+from vctrl.linediff import merge3
+from vctrl.commands.checkout import current_entries, apply_changes, checkout_tree
+from vctrl.commands.diff import diff_trees
+from vctrl.refs import get_ref, update_ref, get_branch_name
+from vctrl.repo import repo_path
+from vctrl.trace import span
 
 def get_tree_entries(tree_oid):
-    tree = GitObject.from_file(tree_oid, expected_type="tree")
-    entries = {}
-    for entry in tree.data.decode().splitlines():
-        parts = entry.split()
-        if len(parts) == 3:
-            type_, oid, path = parts
-            entries[path] = oid
-    return entries
-
-def merge(base_oid, other_oid):
-    base = GitObject.from_file(base_oid, expected_type="commit")
-    other = GitObject.from_file(other_oid, expected_type="commit")
-
-    base_tree_oid = base.data.decode().splitlines()[0].split()[1]
-    other_tree_oid = other.data.decode().splitlines()[0].split()[1]
-
-    base_tree = get_tree_entries(base_tree_oid)
-    other_tree = get_tree_entries(other_tree_oid)
-
-    merged_index = {}
-    conflicts = []
+    return flatten_tree(tree_oid)
+
+
+def _entries(tree_oid):
+    return {entry.name: entry for entry in read_tree(tree_oid)} if tree_oid else {}
+
+
+def _key(entry):
+    return entry and (entry.type, entry.oid)
+
+
+def _oid(entry, type_):
+    return entry.oid if entry is not None and entry.type == type_ else None
+
 
-    for path in set(base_tree) | set(other_tree):
-        base_oid = base_tree.get(path)
-        other_oid = other_tree.get(path)
+# Record in `changes` everything needed to turn our side of `path` into
+# theirs: whole subtrees are compared with diff_trees, so identical parts
+# are never read.
+def _take_theirs(ours, theirs, path, changes):
+    for _, file_path, _, new_oid in diff_trees(_oid(ours, "tree"), _oid(theirs, "tree"), path + "/"):
+        changes[file_path] = new_oid
+    our_blob, their_blob = _oid(ours, "blob"), _oid(theirs, "blob")
+    if our_blob != their_blob:
+        changes[path] = their_blob
 
-        if base_oid == other_oid:
-            merged_index[path] = other_oid
-        elif base_oid is None:
-            merged_index[path] = other_oid
-        elif other_oid is None:
-            merged_index[path] = base_oid
+
+# Both sides changed the same file: merge it line by line against the base
+def _merge_blobs(base, ours, theirs, path, labels, changes, conflicts):
+    if ours is None or theirs is None:
+        conflicts.append((path, "modified on one side, deleted on the other"))
+        return  # keep our side (a deletion stays deleted)
+    data = [get_object(oid, expected_type="blob") if oid else b"" for oid in (base, ours, theirs)]
+    if any(b"\0" in blob[:8000] for blob in data):
+        conflicts.append((path, "binary file changed on both sides"))
+        return  # keep ours
+    lines = [blob.decode("utf-8", "surrogateescape").splitlines(keepends=True) for blob in data]
+    merged, count = merge3(*lines, *labels)
+    if count:
+        conflicts.append((path, f"{count} conflicting hunk{'s' if count > 1 else ''}"))
+    changes[path] = Blob("".join(merged).encode("utf-8", "surrogateescape")).save()
+
+
+# Three-way merge of trees into `changes` ({path: oid, or None to delete},
+# relative to our side). Subtrees with the same oid on two sides are settled
+# without being read: if ours matches the base theirs wins, and vice versa.
+# Blobs are read only for files both sides changed.
+def merge_trees(base, ours, theirs, labels, changes, conflicts, prefix=""):
+    if ours == theirs or theirs == base:
+        return
+    if ours == base:
+        for _, path, _, new_oid in diff_trees(ours, theirs, prefix):
+            changes[path] = new_oid
+        return
+
+    trees = (base, ours, theirs)
+    if any(tree and is_flat_tree(read_tree(tree)) for tree in trees):
+        _merge_flat(*trees, labels, changes, conflicts, prefix)
+        return
+
+    base_entries, our_entries, their_entries = _entries(base), _entries(ours), _entries(theirs)
+    for name in sorted(our_entries.keys() | their_entries.keys()):
+        b, o, t = base_entries.get(name), our_entries.get(name), their_entries.get(name)
+        if _key(o) == _key(t) or _key(t) == _key(b):
+            continue
+        path = prefix + name
+        if _key(o) == _key(b):
+            _take_theirs(o, t, path, changes)
+        elif all(entry is None or entry.type == "tree" for entry in (b, o, t)):
+            merge_trees(_oid(b, "tree"), _oid(o, "tree"), _oid(t, "tree"),
+                        labels, changes, conflicts, path + "/")
+        elif all(entry is None or entry.type == "blob" for entry in (b, o, t)):
+            _merge_blobs(_oid(b, "blob"), _oid(o, "blob"), _oid(t, "blob"),
+                         path, labels, changes, conflicts)
         else:
-            base_data = GitObject.from_file(base_oid).data
-            other_data = GitObject.from_file(other_oid).data
+            conflicts.append((path, "file on one side, directory on the other"))
+
 
-            if base_data != other_data:
-                merged_blob = b"<<<<<<< HEAD\n" + base_data + b"\n=======\n" + other_data + b"\n>>>>>>> MERGE\n"
-                conflict_blob = Blob(merged_blob)
-                oid = conflict_blob.save()
-                merged_index[path] = oid
-                conflicts.append(path)
-            else:
-                merged_index[path] = base_oid
+# merge_trees when a side is a flat (legacy) tree: merge whole paths
+def _merge_flat(base, ours, theirs, labels, changes, conflicts, prefix):
+    base_files, our_files, their_files = (flatten_tree(tree) if tree else {}
+                                          for tree in (base, ours, theirs))
+    for path in sorted(our_files.keys() | their_files.keys()):
+        b, o, t = base_files.get(path), our_files.get(path), their_files.get(path)
+        if o == t or t == b:
+            continue
+        if o == b:
+            changes[prefix + path] = t
+        else:
+            _merge_blobs(b, o, t, prefix + path, labels, changes, conflicts)
 
-    checkout_tree(other_tree_oid)  # naive; consider using merged tree
-    write_index(merged_index)
+
+def merge_head_path():
+    return os.path.join(repo_path(), "MERGE_HEAD")
+
+
+# Merge `other_oid` into the checked-out commit `base_oid`, updating the
+# working directory and index. Returns True for a clean merge, False if
+# conflicts were left in the working directory, None if nothing was done.
+def merge(base_oid, other_oid, other_label="MERGE"):
+    if get_ref("HEAD") != base_oid:
+        print("❌ Merge into a branch that is checked out.")
+        return None
+
+    with span("merge.bases"):
+        bases = merge_bases(base_oid, other_oid)
+    ancestor_tree = read_commit(bases[0]).tree if bases else None
+    our_tree = read_commit(base_oid).tree
+    their_tree = read_commit(other_oid).tree
+
+    if write_tree() not in (None, our_tree):
+        print("❌ You have staged changes; commit them before merging.")
+        return None
+    current, cache_tree = current_entries()  # read after write_tree refreshed the cache tree
+
+    changes = {}
+    conflicts = []
+    with span("merge.trees"):
+        merge_trees(ancestor_tree, our_tree, their_tree, ("HEAD", other_label), changes, conflicts)
+
+    for path in changes:
+        invalidate_cache_tree(cache_tree, path)
+    if not apply_changes(current, changes, cache_tree, action="merge"):
+        return None
 
     if conflicts:
         print("Merge completed with conflicts in:")
-        for path in conflicts:
-            print(f"  - {path}")
-    else:
-        print("Merge successful with no conflicts.")
+        for path, reason in conflicts:
+            print(f"  - {path} ({reason})")
+        return False
+    print("Merge successful with no conflicts.")
+    return True
+
+
+# Merge branch `other` into branch `base`. Ancestry is checked first: if
+# `other` is already contained in `base` nothing is read or written, and
+# if `base` is behind `other` only the ref moves (plus the changed files,
+# when `base` is checked out). Otherwise the trees are merged and a commit
+# with both parents is written; on conflicts MERGE_HEAD records `other` so
+# the next commit becomes the merge commit.
+def merge_branches(base, other):
+    base_oid = get_ref(f"refs/heads/{base}")
+    other_oid = get_ref(f"refs/heads/{other}")
+    for name, oid in ((base, base_oid), (other, other_oid)):
+        if not oid:
+            print(f"❌ Branch '{name}' not found.")
+            return
+
+    if is_ancestor(other_oid, base_oid):
+        print("Already up to date.")
+        return
+
+    checked_out = get_branch_name() == base
+    if is_ancestor(base_oid, other_oid):
+        if checked_out and not checkout_tree(read_commit(other_oid).tree):
+            return
+        update_ref(f"refs/heads/{base}", other_oid)
+        print(f"Fast-forward {base} {base_oid[:7]}..{other_oid[:7]}")
+        return
+
+    if not checked_out:
+        print(f"❌ Check out '{base}' to merge '{other}' into it.")
+        return
+    result = merge(base_oid, other_oid, other_label=other)
+    if result is None:
+        return
+    if result is False:
+        with open(merge_head_path(), "w") as f:
+            f.write(other_oid)
+        print("Fix the conflicts, then add and commit the result.")
+        return
+
+    commit = Commit(tree_oid=write_tree(), parents=[base_oid, other_oid],
+                    message=f"Merge branch '{other}' into {base}",
+                    author_name=os.environ.get("GIT_AUTHOR_NAME", "you"),
+                    author_email=os.environ.get("GIT_AUTHOR_EMAIL", "notknown"))
+    oid = commit.save()
+    update_ref(f"refs/heads/{base}", oid)
+    print(f"Committed merge: {oid[:7]}")
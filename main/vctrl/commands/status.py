@@ -0,0 +1,190 @@
+import os
+import sys
+from vctrl.index import index_path, load_fsmonitor_state, write_index, IndexEntry, FsmonitorState
+from vctrl.objects import read_tree, read_commit, hash_file, flatten_tree, is_flat_tree
+from vctrl.refs import get_ref, get_branch_name
+from vctrl.repo import repo_path
+from vctrl.worktree import changed_files
+from vctrl.trace import span
+
+LABELS = {"A": "new file", "M": "modified", "D": "deleted"}
+
+# With a file system monitor the index is rewritten to record a new token
+# only once this many paths would otherwise be looked at again on every
+# status, since rewriting a large index costs more than a few lstat calls
+FSMONITOR_REWRITE_THRESHOLD = 1000
+
+
+# Nest index entries by directory: {name: IndexEntry or {name: ...}}
+def _index_tree(entries):
+    root = {}
+    for path, entry in entries.items():
+        *dirs, name = path.split("/")
+        node = root
+        for part in dirs:
+            node = node.setdefault(part, {})
+        node[name] = entry
+    return root
+
+
+# Yield (status, path) for every file that differs between a tree and the
+# nested index. A directory whose cache tree oid equals the tree's oid is
+# unchanged and skipped without being read, so after a commit or checkout
+# this touches nothing at all.
+def _staged(tree_oid, node, cache_tree, dir_path=""):
+    if tree_oid and cache_tree.get(dir_path) == tree_oid:
+        return
+    entries = read_tree(tree_oid) if tree_oid else ()
+    if is_flat_tree(entries):
+        yield from _staged_flat(flatten_tree(tree_oid), node, dir_path)
+        return
+    head = {entry.name: entry for entry in entries}
+    for name in sorted(head.keys() | node.keys()):
+        path = f"{dir_path}/{name}" if dir_path else name
+        head_entry, child = head.get(name), node.get(name)
+        head_is_tree = head_entry is not None and head_entry.type == "tree"
+        if head_is_tree or isinstance(child, dict):
+            yield from _staged(head_entry.oid if head_is_tree else None,
+                               child if isinstance(child, dict) else {},
+                               cache_tree, path)
+
+        head_blob = head_entry.oid if head_entry and not head_is_tree else None
+        index_blob = child.oid if isinstance(child, IndexEntry) else None
+        if head_blob and index_blob:
+            if head_blob != index_blob:
+                yield "M", path
+        elif head_blob:
+            yield "D", path
+        elif index_blob:
+            yield "A", path
+
+
+# _staged for a flat (legacy) tree: compare {path: oid} with the nested
+# index below `dir_path`, path by path
+def _staged_flat(head_files, node, dir_path):
+    index_files = {}
+    stack = [(node, "")]
+    while stack:
+        current, prefix = stack.pop()
+        for name, child in current.items():
+            if isinstance(child, dict):
+                stack.append((child, f"{prefix}{name}/"))
+            else:
+                index_files[prefix + name] = child.oid
+    for rel_path in sorted(head_files.keys() | index_files.keys()):
+        path = f"{dir_path}/{rel_path}" if dir_path else rel_path
+        head_blob, index_blob = head_files.get(rel_path), index_files.get(rel_path)
+        if head_blob and index_blob:
+            if head_blob != index_blob:
+                yield "M", path
+        elif head_blob:
+            yield "D", path
+        else:
+            yield "A", path
+
+
+# Compare HEAD's tree with the index, then the index with the working tree.
+# Returns (staged {path: status}, unstaged {path: status}, untracked paths).
+# Tracked files whose stat data matches the index are trusted; the others
+# are hashed without writing objects, and those found unchanged get their
+# stat data refreshed in the index so the next status skips them too. With
+# a file system monitor running (see vctrl.fsmonitor) only the paths it saw
+# change are looked at.
+def collect_status():
+    from vctrl.commands.checkout import current_entries
+
+    before = _stat_key(index_path())
+    entries, cache_tree = current_entries()
+    state = load_fsmonitor_state()
+
+    head = get_ref("HEAD")
+    head_tree = read_commit(head).tree if head else None
+    if head_tree and cache_tree.get("") == head_tree:
+        staged = {}  # nothing staged; don't even nest the index
+    else:
+        with span("status.staged"):
+            staged = {path: status for status, path in
+                      _staged(head_tree, _index_tree(entries), cache_tree)}
+
+    token, found, complete = changed_files(entries, state)
+    unstaged = {}
+    refreshed = False
+    with span("status.compare"):
+        for path in (entries if complete else [path for path in found if path in entries]):
+            entry = entries[path]
+            try:
+                st = found.get(path) or (os.stat(path) if complete else None)  # tracked files may be ignored
+            except FileNotFoundError:
+                st = None
+            if st is None:
+                unstaged[path] = "D"
+                continue
+            if entry.matches(st):
+                continue
+            try:
+                oid = hash_file(path, write=False)
+            except FileNotFoundError:
+                unstaged[path] = "D"
+                continue
+            if oid != entry.oid:
+                unstaged[path] = "M"
+            else:
+                entries[path] = IndexEntry.from_stat(oid, st)
+                refreshed = True
+    untracked = sorted(path for path, st in found.items() if st is not None and path not in entries)
+
+    # Save what was learned: refreshed stat data, and with a monitor the new
+    # token, once the set of changes to replay has grown. Best effort: skip
+    # it if someone else wrote the index meanwhile.
+    new_state = FsmonitorState(token, untracked, sorted(unstaged)) if token else None
+    if token and (complete or len(found) > FSMONITOR_REWRITE_THRESHOLD):
+        refreshed = True
+    if refreshed and _stat_key(index_path()) == before:
+        write_index(entries, cache_tree, new_state)
+    return staged, unstaged, untracked
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _labelled(changes):
+    return [f"{LABELS[s] + ':':<12}{p}" for p, s in sorted(changes.items())]
+
+
+def status(porcelain=False):
+    staged, unstaged, untracked = collect_status()
+    out = sys.stdout
+
+    # "XY path": X is the index against HEAD, Y the working tree against the
+    # index, "??" an untracked file
+    if porcelain:
+        for path in sorted(staged.keys() | unstaged.keys()):
+            out.write(f"{staged.get(path, ' ')}{unstaged.get(path, ' ')} {path}\n")
+        for path in untracked:
+            out.write(f"?? {path}\n")
+        return
+
+    branch = get_branch_name()
+    if branch:
+        out.write(f"📍 You are on branch: {branch}\n")
+    else:
+        out.write(f"📍 HEAD detached at {get_ref('HEAD')[:7]}\n")
+    if os.path.exists(os.path.join(repo_path(), "MERGE_HEAD")):
+        out.write("🔀 Merge in progress: commit to conclude it\n")
+
+    sections = [
+        ("Changes to be committed:", _labelled(staged)),
+        ("Changes not staged for commit:", _labelled(unstaged)),
+        ("Untracked files:", untracked),
+    ]
+    for title, lines in sections:
+        if lines:
+            out.write(f"\n{title}\n")
+            out.writelines(f"  {line}\n" for line in lines)
+    if not (staged or unstaged or untracked):
+        out.write("✅ Nothing to commit, working tree clean\n")
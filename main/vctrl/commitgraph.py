@@ -0,0 +1,209 @@
+import os, struct, hashlib
+from vctrl.repo import current_repository
+
+# Commit graph (objects/info/commit-graph):
+#   header   "VCGR" | u32 version | u32 commit count | u32 extra edge count
+#   fanout   256 x u32, entry i = number of oids whose first byte <= i
+#   oids     count x 20 raw bytes, sorted
+#   rows     count x (20-byte tree oid | u32 parent 1 | u32 parent 2 |
+#                     u32 generation | u64 author timestamp)
+#   edges    extra edge count x u32
+#   trailer  SHA-1 of everything above
+#
+# Rows are in oid order and parents are stored as row positions, so history
+# walks never inflate a commit object. A commit with more than two parents
+# has EXTRA_EDGES | i as its second parent: its other parents are edges[i:]
+# up to and including the first entry with LAST_EDGE set.
+GRAPH_SIGNATURE = b"VCGR"
+GRAPH_VERSION = 1
+NO_PARENT = 0xFFFFFFFF
+EXTRA_EDGES = 0x80000000
+LAST_EDGE = 0x80000000
+
+_HEADER = struct.Struct(">4sIII")
+_FANOUT = struct.Struct(">256I")
+_ROW = struct.Struct(">20sIIIQ")
+_EDGE = struct.Struct(">I")
+
+
+def graph_path():
+    return os.path.join(current_repository().info_dir, "commit-graph")
+
+
+class CommitGraph:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read()
+        signature, version, self.count, edge_count = _HEADER.unpack_from(data, 0)
+        if signature != GRAPH_SIGNATURE or version != GRAPH_VERSION:
+            raise ValueError(f"Unsupported commit graph: {path}")
+
+        self._fanout = _FANOUT.unpack_from(data, _HEADER.size)
+        self._oids_start = _HEADER.size + _FANOUT.size
+        self._rows_start = self._oids_start + 20 * self.count
+        self._edges_start = self._rows_start + _ROW.size * self.count
+        if len(data) != self._edges_start + _EDGE.size * edge_count + 20:
+            raise ValueError(f"Corrupt commit graph: {path}")
+        self._data = data
+
+    def oid_at(self, pos):
+        start = self._oids_start + 20 * pos
+        return self._data[start:start + 20].hex()
+
+    def find(self, oid):
+        key = bytes.fromhex(oid)
+        first = key[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        data, start = self._data, self._oids_start
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = data[start + 20 * mid:start + 20 * mid + 20]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def __contains__(self, oid):
+        return self.find(oid) is not None
+
+    def __len__(self):
+        return self.count
+
+    # (tree oid, parent positions, generation, timestamp) of a row
+    def row(self, pos):
+        tree, first, second, generation, timestamp = _ROW.unpack_from(
+            self._data, self._rows_start + _ROW.size * pos)
+        if first == NO_PARENT:
+            parents = ()
+        elif second == NO_PARENT:
+            parents = (first,)
+        elif not second & EXTRA_EDGES:
+            parents = (first, second)
+        else:
+            parents = [first]
+            edge = second & ~EXTRA_EDGES
+            while True:
+                (value,) = _EDGE.unpack_from(self._data, self._edges_start + _EDGE.size * edge)
+                parents.append(value & ~LAST_EDGE)
+                if value & LAST_EDGE:
+                    break
+                edge += 1
+            parents = tuple(parents)
+        return tree.hex(), parents, generation, timestamp
+
+    def parents(self, pos):
+        return tuple(self.oid_at(parent) for parent in self.row(pos)[1])
+
+    def generation(self, pos):
+        return self.row(pos)[2]
+
+    def timestamp(self, pos):
+        return self.row(pos)[3]
+
+
+_graphs = {}  # graph path -> ((mtime, size), CommitGraph or None)
+
+
+# The repository's commit graph, or None if it has not been written. The
+# file is replaced atomically, so it is reloaded only when its stat changes.
+def load_commit_graph():
+    path = graph_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _graphs.pop(path, None)
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _graphs.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    graph = CommitGraph(path)
+    _graphs[path] = (key, graph)
+    return graph
+
+
+# Rebuild the commit graph from every commit reachable from the refs and
+# HEAD. Commits already in the old graph are copied from it, so only new
+# commits are inflated. Returns (path, commit count).
+def write_commit_graph():
+    from vctrl.objects import read_commit
+    from vctrl.refs import get_ref, list_refs
+
+    old = load_commit_graph()
+    commits = {}  # oid -> (tree, parent oids, timestamp)
+    stack = [oid for _, oid in list_refs()]
+    head = get_ref("HEAD")
+    if head:
+        stack.append(head)
+    while stack:
+        oid = stack.pop()
+        if oid in commits:
+            continue
+        pos = old.find(oid) if old is not None else None
+        if pos is not None:
+            tree, _, _, timestamp = old.row(pos)
+            parents = old.parents(pos)
+        else:
+            info = read_commit(oid)
+            tree, parents, timestamp = info.tree, info.parents, info.timestamp
+        commits[oid] = (tree, parents, timestamp)
+        stack.extend(parent for parent in parents if parent not in commits)
+
+    # Generation numbers, parents first, without recursion
+    generations = {}
+    for oid in commits:
+        stack = [oid]
+        while stack:
+            top = stack[-1]
+            if top in generations:
+                stack.pop()
+                continue
+            missing = [p for p in commits[top][1] if p not in generations]
+            if missing:
+                stack.extend(missing)
+                continue
+            generations[top] = 1 + max((generations[p] for p in commits[top][1]), default=0)
+            stack.pop()
+
+    oids = sorted(commits)
+    positions = {oid: pos for pos, oid in enumerate(oids)}
+    fanout = [0] * 256
+    for oid in oids:
+        fanout[int(oid[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    rows = []
+    edges = []
+    for oid in oids:
+        tree, parents, timestamp = commits[oid]
+        parent_positions = [positions[p] for p in parents]
+        first = parent_positions[0] if parent_positions else NO_PARENT
+        if len(parent_positions) <= 2:
+            second = parent_positions[1] if len(parent_positions) == 2 else NO_PARENT
+        else:
+            second = EXTRA_EDGES | len(edges)
+            edges.extend(parent_positions[1:-1])
+            edges.append(parent_positions[-1] | LAST_EDGE)
+        rows.append(_ROW.pack(bytes.fromhex(tree), first, second, generations[oid], timestamp))
+
+    body = b"".join([
+        _HEADER.pack(GRAPH_SIGNATURE, GRAPH_VERSION, len(oids), len(edges)),
+        _FANOUT.pack(*fanout),
+        b"".join(bytes.fromhex(oid) for oid in oids),
+        b"".join(rows),
+        b"".join(_EDGE.pack(edge) for edge in edges),
+    ])
+    path = graph_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(body + hashlib.sha1(body).digest())
+    os.replace(tmp_path, path)
+    return path, len(oids)
@@ -0,0 +1,284 @@
+import io
+import os
+import sys
+import json
+import struct
+from contextlib import redirect_stdout, redirect_stderr
+from vctrl.repo import Repository
+
+# `vctrl daemon` keeps one process per repository listening on
+# .vctrl/daemon.sock. Imports, the parsed index, refs, the commit graph,
+# the ignore matcher and the object cache then stay warm between commands;
+# every one of those caches is checked against the files it came from, so
+# the daemon sees changes made by anyone else. The daemon also runs a file
+# system monitor (vctrl.fsmonitor), so status, diff and `add .` issued
+# from the top of the working tree only look at paths that changed.
+#
+# Protocol: the daemon answers every connection with frames
+#   kind (1 byte) | u32 length | payload
+# where kind is "r" ready, "o" stdout, "e" stderr or "x" exit. It first
+# sends an empty "r" frame; the client then sends one JSON line {"argv",
+# "cwd", "env"} (or {"stop": true}) and gets the command's output, ending
+# with an "x" frame whose payload is the exit code. Commands run one at a
+# time because each one needs the client's cwd and environment, so neither
+# side waits long for the other: a client that gets no "r" frame within
+# READY_TIMEOUT runs the command itself, and one that doesn't send its
+# request within REQUEST_TIMEOUT is dropped.
+#
+# A request runs with the daemon's privileges in whatever cwd and
+# environment it names, so only the daemon's owner may send one: the
+# socket is created 0600, and where the kernel reports the peer's
+# credentials (SO_PEERCRED on Linux) connections from other users are
+# refused as well.
+SOCKET_NAME = "daemon.sock"
+NO_DAEMON_ENV = "VCTRL_NO_DAEMON"
+READY_TIMEOUT = 2.0  # seconds
+REQUEST_TIMEOUT = 2.0
+
+_FRAME = struct.Struct(">cI")
+
+
+def socket_path(repo=None):
+    return os.path.join((repo or Repository.discover()).path, SOCKET_NAME)
+
+
+def _send(conn, kind, payload):
+    conn.sendall(_FRAME.pack(kind, len(payload)) + payload)
+
+
+def _recv_exactly(conn, n):
+    chunks = []
+    while n:
+        chunk = conn.recv(n)
+        if not chunk:
+            raise ConnectionError("daemon closed the connection")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+# A text stream that forwards everything written to it as frames
+class _Channel(io.TextIOBase):
+
+    def __init__(self, conn, kind):
+        self._conn = conn
+        self._kind = kind
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            _send(self._conn, self._kind, text.encode("utf-8", "surrogateescape"))
+        return len(text)
+
+
+def _connect(path):
+    import socket
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError, PermissionError):
+        conn.close()
+        return None  # no daemon, a stale socket left by one that died, or someone else's
+    return conn
+
+
+# Send a request and relay the daemon's output. Returns the exit code, or
+# None if the daemon (busy with another command) did not get to it within
+# `timeout` seconds; the request is not sent then.
+def _request(conn, request, timeout=READY_TIMEOUT):
+    with conn:
+        conn.settimeout(timeout)
+        try:
+            _recv_exactly(conn, _FRAME.size)  # the "r" frame
+        except TimeoutError:
+            return None
+        conn.settimeout(None)
+        conn.sendall(json.dumps(request).encode() + b"\n")
+        streams = {b"o": sys.stdout.buffer, b"e": sys.stderr.buffer}
+        while True:
+            kind, length = _FRAME.unpack(_recv_exactly(conn, _FRAME.size))
+            payload = _recv_exactly(conn, length)
+            if kind == b"x":
+                return int(payload)
+            streams[kind].write(payload)
+            streams[kind].flush()
+
+
+# Run a command in the repository's daemon if one is listening. Returns its
+# exit code, or None when the command should run in this process instead.
+def forward(argv):
+    if os.environ.get(NO_DAEMON_ENV):
+        return None
+    try:
+        path = socket_path()
+    except Exception:
+        return None  # not in a repository; let the command report it
+    if not os.path.exists(path):
+        return None
+    conn = _connect(path)
+    if conn is None:
+        return None
+    try:
+        return _request(conn, {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)})
+    except BrokenPipeError:
+        # Output piped into something like `head` that stopped reading
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+
+def _exit_code(exc):
+    if exc.code is None or isinstance(exc.code, int):
+        return exc.code or 0
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+# The uid of the process at the other end of `conn`, or None if the
+# platform doesn't say
+def _peer_uid(conn):
+    import socket
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+# Run one command with the client's cwd, environment and output streams
+def _run(conn, request):
+    import traceback
+    from vctrl.cli import run
+
+    saved_cwd, saved_env = os.getcwd(), dict(os.environ)
+    stdout, stderr = _Channel(conn, b"o"), _Channel(conn, b"e")
+    try:
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                run(request["argv"])
+                return 0
+            except SystemExit as exc:
+                return _exit_code(exc)
+            except (BrokenPipeError, ConnectionResetError):
+                raise  # the client went away
+            except Exception:
+                traceback.print_exc()
+                return 1
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+
+
+# Load what every command needs, so the first request is as fast as the rest
+def _warm_up():
+    from vctrl import cli
+    from vctrl.commands import branch, checkout, diff, gc, log, merge, status
+    from vctrl.commitgraph import load_commit_graph
+    from vctrl.ignore import load_ignore
+    from vctrl.index import load_index
+    from vctrl.refs import packed_refs, get_ref
+
+    load_index()
+    packed_refs()
+    get_ref("HEAD")
+    load_commit_graph()
+    load_ignore()
+
+
+# Serve commands for the repository containing the cwd until stopped
+def serve():
+    import socket
+    from vctrl.fsmonitor import start_monitor, stop_monitor
+
+    repo = Repository.discover()
+    path = socket_path(repo)
+    conn = _connect(path)
+    if conn is not None:
+        conn.close()
+        raise RuntimeError(f"❌ A daemon is already listening on {path}")
+    if os.path.exists(path):
+        os.unlink(path)
+
+    os.chdir(repo.root)
+    _warm_up()
+    monitor = start_monitor(repo.root)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        umask = os.umask(0o077)  # no window where the socket is open to others
+        try:
+            server.bind(path)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        server.listen(64)
+        watching = f" (watching with {type(monitor).__name__})" if monitor else ""
+        print(f"👂 Listening on {path}{watching}", flush=True)
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    _send(conn, b"r", b"")
+                    conn.settimeout(REQUEST_TIMEOUT)
+                    line = conn.makefile("rb").readline()
+                    conn.settimeout(None)
+                    uid = _peer_uid(conn)
+                    if uid is not None and uid != os.getuid():
+                        _send(conn, b"e", "❌ This daemon only serves its owner\n".encode())
+                        _send(conn, b"x", b"1")
+                        continue
+                    request = json.loads(line)
+                    if request.get("stop"):
+                        _send(conn, b"x", b"0")
+                        break
+                    _send(conn, b"x", str(_run(conn, request)).encode())
+                except (OSError, ValueError):
+                    continue  # the client went away or sent garbage
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        stop_monitor(repo.root)
+
+
+def daemon_running():
+    try:
+        conn = _connect(socket_path())
+    except Exception:
+        return False
+    if conn is None:
+        return False
+    conn.close()
+    return True
+
+
+def stop_daemon():
+    conn = _connect(socket_path())
+    if conn is None:
+        return False
+    _request(conn, {"stop": True}, timeout=None)  # after the command it is running
+    return True
+
+
+# Start `vctrl daemon start` in the background and wait until it answers
+def spawn_daemon(timeout=10.0):
+    import subprocess, time
+
+    subprocess.Popen([sys.executable, "-m", "vctrl.cli", "daemon", "start"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True,
+                     env={**os.environ, NO_DAEMON_ENV: "1"})
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if daemon_running():
+            return True
+        time.sleep(0.05)
+    return False
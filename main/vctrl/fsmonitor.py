@@ -0,0 +1,305 @@
+import os
+import sys
+import select
+import struct
+import threading
+from vctrl.repo import REPO_DIR, current_repository
+from vctrl.ignore import IGNORE_FILE, load_ignore
+from vctrl.worktree import _scan_dir
+
+# A file system monitor watches a working tree from a long-running process
+# (the daemon, or any program that calls start_monitor) and numbers every
+# path it sees change. A token "<monitor id>:<sequence>" names a moment;
+# the paths changed since a token are those with a higher number. The index
+# stores the token of the last full comparison (see FsmonitorState), so
+# status, diff and `add .` only look at what changed since.
+#
+# Paths are relative to the top of the working tree; a trailing "/" marks a
+# directory that appeared, vanished or moved and must be rescanned. A new
+# monitor id (a restart, an inotify queue overflow, an edit to
+# .vctrlignore) makes every older token stale, which means one full scan.
+#
+# On Linux, inotify watches every directory that is not ignored. Elsewhere,
+# or when inotify is unavailable or out of watches, the tree is rescanned
+# every POLL_INTERVAL seconds and compared with the previous scan.
+FSMONITOR_ENV = "VCTRL_FSMONITOR"  # "0" disables, "poll" forces polling
+POLL_INTERVAL = 1.0
+SYNC_TIMEOUT = 2.0
+COOKIE_PREFIX = "fsmonitor-cookie-"
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class _Monitor:
+
+    def __init__(self, root):
+        self.root = root
+        self.repo_dir = os.path.join(root, REPO_DIR)
+        self._cond = threading.Condition()
+        self._changed = {}  # path -> sequence number of its last change
+        self._seq = 0
+        self._id = os.urandom(4).hex()
+        self.failed = False  # set when changes may have been missed for good
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vctrl-fsmonitor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _mark(self, path):
+        with self._cond:
+            self._seq += 1
+            self._changed[path] = self._seq
+
+    # Forget everything: no earlier token is valid any more
+    def _reset(self):
+        with self._cond:
+            self._id = os.urandom(4).hex()
+            self._changed.clear()
+            self._seq = 0
+
+    def _matcher(self):
+        return load_ignore(self.root)
+
+    # Walk the non-ignored directories below `directory` (absolute) as
+    # (absolute path, relative path with trailing "/", [(file, stat)])
+    def _walk(self, directory, rel_dir):
+        matcher = self._matcher()
+        stack = [(directory, rel_dir)]
+        while stack:
+            path, rel = stack.pop()
+            files, subdirs = _scan_dir(path, rel, "", matcher)
+            yield path, rel, files
+            stack.extend(subdirs)
+
+    # (current token, paths changed since `token` or None if it is stale),
+    # read together so no change falls between the two
+    def changes(self, token):
+        monitor_id, _, seq = (token or "").partition(":")
+        with self._cond:
+            current = f"{self._id}:{self._seq}"
+            if monitor_id != self._id:
+                return current, None
+            seq = int(seq)
+            return current, {path for path, changed in self._changed.items() if changed > seq}
+
+
+class InotifyMonitor(_Monitor):
+
+    def __init__(self, root):
+        super().__init__(root)
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._dirs = {}     # watch descriptor -> relative dir ("" or "a/b/"), None for .vctrl
+        self._cookies = {}  # cookie name -> threading.Event
+        self._cookie_count = 0
+        try:
+            self._add_watch(self.repo_dir, None)
+            self._watch_tree(root, "")
+        except OSError:
+            for fd in (self._fd, self._wakeup_r, self._wakeup_w):
+                os.close(fd)
+            raise
+
+    def _add_watch(self, path, rel):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno in (2, 20):  # ENOENT, ENOTDIR: already gone
+                return
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+        self._dirs[wd] = rel
+
+    # Watch every non-ignored directory below `path`; those already
+    # watched keep their watch descriptor
+    def _watch_tree(self, path, rel):
+        for sub_path, sub_rel, _ in self._walk(path, rel):
+            self._add_watch(sub_path, sub_rel)
+
+    def stop(self):
+        self._stop.set()
+        os.write(self._wakeup_w, b"x")
+        self._thread.join()
+        for fd in (self._fd, self._wakeup_r, self._wakeup_w):
+            os.close(fd)
+
+    def _run(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd, self._wakeup_r], [], [])
+            if self._fd in ready:
+                self._handle(os.read(self._fd, 256 * 1024))
+
+    def _handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._reset()
+                continue
+            if mask & IN_IGNORED or wd not in self._dirs:
+                self._dirs.pop(wd, None)
+                continue
+            rel = self._dirs[wd]
+            if rel is None:
+                # The .vctrl directory: only cookies matter
+                event = self._cookies.pop(name, None)
+                if event is not None:
+                    event.set()
+                continue
+            if not name or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue  # reported by the parent directory as well
+            path = rel + name
+            if not rel and name == REPO_DIR:
+                continue
+            if not rel and name == IGNORE_FILE:
+                # Directories that are no longer ignored need watches
+                # before the new token is handed out
+                try:
+                    self._watch_tree(self.root, "")
+                except OSError:
+                    self.failed = True
+                self._reset()
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self._matcher().is_ignored(path, is_dir=True):
+                    try:
+                        self._watch_tree(os.path.join(self.root, path), path + "/")
+                    except OSError:
+                        self.failed = True  # out of watches: this directory is blind
+                self._mark(path + "/")
+            elif not self._matcher().is_ignored(path):
+                self._mark(path)
+
+    # Wait until every event that happened before this call has been
+    # handled, by creating a file and waiting for its own event
+    def sync(self, timeout=SYNC_TIMEOUT):
+        if self.failed or not self._thread.is_alive():
+            return False
+        event = threading.Event()
+        with self._cond:
+            self._cookie_count += 1
+            name = f"{COOKIE_PREFIX}{os.getpid()}-{self._cookie_count}"
+            self._cookies[name] = event
+        path = os.path.join(self.repo_dir, name)
+        open(path, "w").close()
+        try:
+            return event.wait(timeout)
+        finally:
+            self._cookies.pop(name, None)
+            os.unlink(path)
+
+
+class PollingMonitor(_Monitor):
+
+    def __init__(self, root, interval=POLL_INTERVAL):
+        super().__init__(root)
+        self.interval = interval
+        self._pass_lock = threading.Lock()
+        self._snapshot = self._scan()
+        self._ignore_key = self._ignore_stat()
+
+    def _ignore_stat(self):
+        try:
+            st = os.stat(os.path.join(self.root, IGNORE_FILE))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _scan(self):
+        snapshot = {}
+        for _, _, files in self._walk(self.root, ""):
+            for rel, st in files:
+                snapshot[rel] = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino, st.st_mode)
+        return snapshot
+
+    def _poll(self):
+        with self._pass_lock:
+            ignore_key = self._ignore_stat()
+            current = self._scan()
+            if ignore_key != self._ignore_key:
+                self._ignore_key = ignore_key
+                self._reset()
+            else:
+                previous = self._snapshot
+                for path in previous.keys() - current.keys():
+                    self._mark(path)
+                for path, key in current.items():
+                    if previous.get(path) != key:
+                        self._mark(path)
+            self._snapshot = current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._poll()
+
+    def sync(self, timeout=SYNC_TIMEOUT):
+        self._poll()
+        return True
+
+
+_monitors = {}  # working tree root -> monitor
+
+
+# Start watching the working tree at `root` on a background thread
+def start_monitor(root):
+    mode = os.environ.get(FSMONITOR_ENV, "")
+    if mode == "0":
+        return None
+    monitor = None
+    if mode != "poll" and sys.platform.startswith("linux"):
+        try:
+            monitor = InotifyMonitor(root)
+        except (OSError, AttributeError):
+            monitor = None  # no inotify, or out of watches
+    if monitor is None:
+        monitor = PollingMonitor(root)
+    _monitors[root] = monitor.start()
+    return monitor
+
+
+def stop_monitor(root):
+    monitor = _monitors.pop(root, None)
+    if monitor is not None:
+        monitor.stop()
+
+
+# (new token, paths changed since `token`) for the current repository.
+# The paths are None when `token` is stale or missing; both are None when
+# no monitor is running or it could not catch up in time.
+def query(token):
+    monitor = _monitors.get(current_repository().root)
+    if monitor is None or not monitor.sync():
+        return None, None
+    return monitor.changes(token)
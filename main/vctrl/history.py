@@ -0,0 +1,148 @@
+import heapq
+import itertools
+from vctrl.objects import read_commit
+from vctrl.commitgraph import load_commit_graph
+
+# Walk flags for merge-base discovery
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+RESULT = 8
+
+# Generation numbers of commits outside the commit graph. They never change
+# for a given commit, so they are kept for the life of the process.
+_generations = {}
+
+
+# Parents, generation and timestamp come from the commit graph when the
+# commit is in it; only commits written since the graph are inflated. Walks
+# look the graph up once and pass it down.
+def _parents(graph, oid):
+    pos = graph.find(oid) if graph is not None else None
+    if pos is not None:
+        return graph.parents(pos)
+    return read_commit(oid).parents
+
+
+def _commit_time(graph, oid):
+    pos = graph.find(oid) if graph is not None else None
+    if pos is not None:
+        return graph.timestamp(pos)
+    return read_commit(oid).timestamp
+
+
+def _known_generation(graph, oid):
+    pos = graph.find(oid) if graph is not None else None
+    if pos is not None:
+        return graph.generation(pos)
+    return _generations.get(oid)
+
+
+# A commit's generation is one more than the largest generation among its
+# parents (root commits are 1). Any ancestor of a commit has a strictly
+# smaller generation, which lets walks stop early. Computed iteratively so
+# long histories don't hit the recursion limit.
+def _generation(graph, oid):
+    known = _known_generation(graph, oid)
+    if known is not None:
+        return known
+    stack = [oid]
+    while stack:
+        top = stack[-1]
+        if _known_generation(graph, top) is not None:
+            stack.pop()
+            continue
+        top_parents = _parents(graph, top)
+        missing = [p for p in top_parents if _known_generation(graph, p) is None]
+        if missing:
+            stack.extend(missing)
+            continue
+        _generations[top] = 1 + max((_known_generation(graph, p) for p in top_parents), default=0)
+        stack.pop()
+    return _generations[oid]
+
+
+def parents(oid):
+    return _parents(load_commit_graph(), oid)
+
+
+def commit_time(oid):
+    return _commit_time(load_commit_graph(), oid)
+
+
+def generation(oid):
+    return _generation(load_commit_graph(), oid)
+
+
+# Best common ancestors of two commits. Both sides are painted down the
+# graph in generation order (highest first); a commit reached from both is a
+# candidate base, and everything below it is marked stale so the walk ends
+# once only stale commits are left. Candidates that turn out to be reachable
+# from a better one are dropped.
+def merge_bases(one, two):
+    if one == two:
+        return [one]
+    graph = load_commit_graph()
+    flags = {one: PARENT1, two: PARENT2}
+    # Queue entries remember whether they were pushed stale; `active` counts
+    # the ones that weren't, so the loop test stays O(1)
+    queue = [(-_generation(graph, one), one, False), (-_generation(graph, two), two, False)]
+    active = 2
+    candidates = []
+
+    while active:
+        _, oid, was_stale = heapq.heappop(queue)
+        if not was_stale:
+            active -= 1
+        oid_flags = flags[oid] & (PARENT1 | PARENT2 | STALE)
+        if oid_flags == PARENT1 | PARENT2:
+            if not flags[oid] & RESULT:
+                flags[oid] |= RESULT
+                candidates.append(oid)
+            oid_flags |= STALE
+        for parent in _parents(graph, oid):
+            parent_flags = flags.get(parent, 0)
+            if parent_flags & oid_flags == oid_flags:
+                continue
+            flags[parent] = parent_flags | oid_flags
+            stale = bool(oid_flags & STALE)
+            heapq.heappush(queue, (-_generation(graph, parent), parent, stale))
+            if not stale:
+                active += 1
+
+    return [oid for oid in candidates if not flags[oid] & STALE]
+
+
+# True if `ancestor` is reachable from `descendant` (or is the same commit)
+def is_ancestor(ancestor, descendant):
+    graph = load_commit_graph()
+    target = _generation(graph, ancestor)
+    seen = {descendant}
+    stack = [descendant]
+    while stack:
+        oid = stack.pop()
+        if oid == ancestor:
+            return True
+        for parent in _parents(graph, oid):
+            if parent not in seen and _generation(graph, parent) >= target:
+                seen.add(parent)
+                stack.append(parent)
+    return False
+
+
+# Yield the commits reachable from `tips`, newest first by timestamp, each
+# once. Ties go to whichever commit was queued first, so a commit never
+# comes before the child it was reached from.
+def walk(tips):
+    graph = load_commit_graph()
+    order = itertools.count()
+    queue = [(-_commit_time(graph, oid), next(order), oid) for oid in dict.fromkeys(tips)]
+    heapq.heapify(queue)
+    seen = set(tips)
+    while queue:
+        *_, oid = heapq.heappop(queue)
+        yield oid
+        for parent in _parents(graph, oid):
+            if parent not in seen:
+                seen.add(parent)
+                heapq.heappush(queue, (-_commit_time(graph, parent), next(order), parent))
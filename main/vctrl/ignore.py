@@ -0,0 +1,134 @@
+import os
+import re
+from vctrl.repo import current_repository
+
+# gitignore-style patterns, read from .vctrlignore at the top of the working
+# tree after the built-in defaults:
+#   - blank lines and lines starting with "#" are skipped
+#   - "!" re-includes what an earlier pattern excluded; the last match wins
+#   - a trailing "/" matches directories only
+#   - a pattern with a "/" before its end is anchored at the top of the
+#     tree, otherwise it matches a name at any depth
+#   - "*" and "?" stop at "/", "**" crosses directories, "[...]" is a class
+# Anything inside a matched directory is ignored too; walks prune such
+# directories instead of entering them.
+IGNORE_FILE = ".vctrlignore"
+DEFAULT_PATTERNS = [".vctrl/", ".git/", "__pycache__/", ".DS_Store", "venv/", "build/", "dist/"]
+
+
+def _translate(pattern):
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and pattern.find("]", i + 2) >= 0:
+            end = pattern.find("]", i + 2)
+            body = pattern[i + 1:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+            continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+# Parse one line into (negate, regex for files, regex for directories), or
+# None for blanks and comments
+def _compile_line(line):
+    line = line.rstrip("\n").rstrip(" ")
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    if line.startswith("\\"):
+        line = line[1:] if line[1:2] in ("#", "!") else line
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    anchored = "/" in line
+    regex = _translate(line.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    # A file matches a directory-only pattern only by being inside it
+    inside = regex + "/.*"
+    return negate, (inside if dir_only else regex + "(?:/.*)?"), regex + "(?:/.*)?"
+
+
+class IgnoreMatcher:
+
+    # Consecutive patterns with the same sign are joined into one
+    # alternation, so a path costs one regex match per run of patterns
+    # rather than one per pattern
+    def __init__(self, patterns):
+        self.runs = []  # (negate, file regex, dir regex)
+        group = []
+        for line in patterns:
+            compiled = _compile_line(line)
+            if compiled is None:
+                continue
+            if group and group[-1][0] != compiled[0]:
+                self._close(group)
+                group = []
+            group.append(compiled)
+        if group:
+            self._close(group)
+        self.runs.reverse()  # later patterns take precedence
+
+    def _close(self, group):
+        negate = group[0][0]
+        file_re = re.compile("|".join(f"(?:{file})" for _, file, _ in group))
+        dir_re = re.compile("|".join(f"(?:{dir_})" for _, _, dir_ in group))
+        self.runs.append((negate, file_re.fullmatch, dir_re.fullmatch))
+
+    # `path` is relative to the top of the working tree, "/"-separated
+    def is_ignored(self, path, is_dir=False):
+        for negate, file_match, dir_match in self.runs:
+            if (dir_match if is_dir else file_match)(path):
+                return not negate
+        return False
+
+
+_matchers = {}  # ignore file path -> (mtime, IgnoreMatcher)
+
+
+# The matcher for the working tree at `root` (default: the current
+# repository's), rebuilt only when .vctrlignore changes
+def load_ignore(root=None):
+    path = os.path.join(root or current_repository().root, IGNORE_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _matchers.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    patterns = list(DEFAULT_PATTERNS)
+    if mtime is not None:
+        with open(path, encoding="utf-8", errors="surrogateescape") as f:
+            patterns.extend(f)
+    matcher = IgnoreMatcher(patterns)
+    _matchers[path] = (mtime, matcher)
+    return matcher
@@ -1,32 +1,292 @@
 
 import os
 import json
-from vctrl.repo import repo_path
+import time
+import struct
+import hashlib
+from vctrl.repo import current_repository
+from vctrl.trace import count, span, traced
+
+# On-disk layout (all integers big-endian):
+#   header   "VIDX" | u32 version | u32 entry count
+#   entries  mtime_ns, ctime_ns, size, ino, mode, raw 20-byte oid, u16 path length, path
+#   extensions (optional) 4-byte signature | u32 length | payload
+#   trailer  SHA-1 of everything above
+#
+# The only extension is "TREE", the cache tree: for every directory whose
+# tree object is known, u16 path length, path ("" for the root) and the raw
+# tree oid. Changing an entry drops the cached oids of all its parent
+# directories, so write_tree only re-hashes directories that changed.
+#
+# "FSMN" records what the file system monitor (vctrl.fsmonitor) knew when
+# the working tree was last compared: u16 length and token, then a u32
+# count of untracked paths and a u32 count of tracked paths that were not
+# clean, each followed by its u16-length-prefixed paths. Every other
+# tracked file matched its entry as of the token.
+# Indexes written by older versions are plain JSON ({path: oid}) and are
+# migrated to this format the next time the index is written.
+INDEX_SIGNATURE = b"VIDX"
+INDEX_VERSION = 2
+
+_HEADER = struct.Struct(">4sII")
+_ENTRY = struct.Struct(">qqQQI20sH")
+_EXTENSION = struct.Struct(">4sI")
+_PATH_LEN = struct.Struct(">H")
+_COUNT = struct.Struct(">I")
+CACHE_TREE_SIGNATURE = b"TREE"
+FSMONITOR_SIGNATURE = b"FSMN"
+
+
+class IndexEntry:
+    __slots__ = ("oid", "mtime_ns", "ctime_ns", "size", "ino", "mode")
+
+    def __init__(self, oid, mtime_ns=0, ctime_ns=0, size=0, ino=0, mode=0):
+        self.oid = oid
+        self.mtime_ns = mtime_ns
+        self.ctime_ns = ctime_ns
+        self.size = size
+        self.ino = ino
+        self.mode = mode
+
+    @classmethod
+    def from_stat(cls, oid, st):
+        return cls(oid, st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino, st.st_mode)
+
+    def matches(self, st):
+        # Entries migrated from the JSON index carry no stat data and never match
+        return self.mtime_ns != 0 \
+            and self.mtime_ns == st.st_mtime_ns \
+            and self.ctime_ns == st.st_ctime_ns \
+            and self.size == st.st_size \
+            and self.ino == st.st_ino \
+            and self.mode == st.st_mode
+
+
+class FsmonitorState:
+    __slots__ = ("token", "untracked", "dirty")
+
+    def __init__(self, token, untracked=(), dirty=()):
+        self.token = token
+        self.untracked = list(untracked)
+        self.dirty = list(dirty)
+
 
 def index_path():
-    return os.path.join(repo_path(), "index")
+    return current_repository().index_path
 
-def read_index():
+def _parse_cache_tree(payload):
+    cache_tree = {}
+    offset = 0
+    while offset < len(payload):
+        (path_len,) = _PATH_LEN.unpack_from(payload, offset)
+        offset += _PATH_LEN.size
+        path = payload[offset:offset + path_len].decode("utf-8", "surrogateescape")
+        offset += path_len
+        cache_tree[path] = payload[offset:offset + 20].hex()
+        offset += 20
+    return cache_tree
+
+def _serialize_cache_tree(cache_tree):
+    parts = []
+    for path in sorted(cache_tree):
+        name = path.encode("utf-8", "surrogateescape")
+        parts.append(_PATH_LEN.pack(len(name)) + name + bytes.fromhex(cache_tree[path]))
+    return b"".join(parts)
+
+def _read_paths(payload, offset):
+    (count,) = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+    paths = []
+    for _ in range(count):
+        (path_len,) = _PATH_LEN.unpack_from(payload, offset)
+        offset += _PATH_LEN.size
+        paths.append(payload[offset:offset + path_len].decode("utf-8", "surrogateescape"))
+        offset += path_len
+    return paths, offset
+
+def _parse_fsmonitor(payload):
+    (token_len,) = _PATH_LEN.unpack_from(payload, 0)
+    token = payload[2:2 + token_len].decode()
+    untracked, offset = _read_paths(payload, 2 + token_len)
+    dirty, _ = _read_paths(payload, offset)
+    return FsmonitorState(token, untracked, dirty)
+
+def _serialize_fsmonitor(state):
+    token = state.token.encode()
+    parts = [_PATH_LEN.pack(len(token)), token]
+    for paths in (state.untracked, state.dirty):
+        parts.append(_COUNT.pack(len(paths)))
+        for path in paths:
+            name = path.encode("utf-8", "surrogateescape")
+            parts.append(_PATH_LEN.pack(len(name)) + name)
+    return b"".join(parts)
+
+# Returns (entries, cache tree, FsmonitorState or None)
+def _parse_index(raw):
+    if raw[:1] == b"{":
+        return {path: IndexEntry(oid) for path, oid in json.loads(raw).items()}, {}, None
+
+    if len(raw) < _HEADER.size + 20 or hashlib.sha1(raw[:-20]).digest() != raw[-20:]:
+        raise ValueError("Corrupt index: checksum mismatch")
+    signature, version, count = _HEADER.unpack_from(raw, 0)
+    if signature != INDEX_SIGNATURE or version != INDEX_VERSION:
+        raise ValueError(f"Unsupported index format: {signature!r} v{version}")
+
+    entries = {}
+    offset = _HEADER.size
+    for _ in range(count):
+        mtime_ns, ctime_ns, size, ino, mode, oid, path_len = _ENTRY.unpack_from(raw, offset)
+        offset += _ENTRY.size
+        path = raw[offset:offset + path_len].decode("utf-8", "surrogateescape")
+        offset += path_len
+        entries[path] = IndexEntry(oid.hex(), mtime_ns, ctime_ns, size, ino, mode)
+
+    cache_tree = {}
+    fsmonitor = None
+    while offset < len(raw) - 20:
+        signature, length = _EXTENSION.unpack_from(raw, offset)
+        offset += _EXTENSION.size
+        if signature == CACHE_TREE_SIGNATURE:
+            cache_tree = _parse_cache_tree(raw[offset:offset + length])
+        elif signature == FSMONITOR_SIGNATURE:
+            fsmonitor = _parse_fsmonitor(raw[offset:offset + length])
+        offset += length  # unknown extensions are skipped
+    return entries, cache_tree, fsmonitor
+
+_parsed = {}  # index path -> ((mtime, size, inode), entries, cache tree, fsmonitor)
+
+def _load():
+    path = index_path()
     try:
-        with open(index_path(), 'r') as f:
-            return json.load(f)
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            key = (st.st_mtime_ns, st.st_size, st.st_ino)
+            cached = _parsed.get(path)
+            if cached and cached[0] == key:
+                count("index.cache_hit")
+                return cached[1:]
+            raw = f.read()
     except FileNotFoundError:
-        return {}
+        return {}, {}, None
+    count("syscall.open")
+    count("bytes.index_read", len(raw))
+    with span("index.parse"):
+        _parsed[path] = (key, *_parse_index(raw))
+    return _parsed[path][1:]
+
+
+# Returns ({path: IndexEntry}, cache tree {dir path: tree oid}). The parsed
+# index is kept per process and reused while the file's stat data is
+# unchanged (the index is always replaced by a rename, never edited in
+# place); callers get their own copies of the dicts to modify.
+def load_index():
+    entries, cache_tree, _ = _load()
+    return dict(entries), dict(cache_tree)
+
+# The file system monitor state saved with the index, or None
+def load_fsmonitor_state():
+    return _load()[2]
+
+def read_index_entries():
+    return load_index()[0]
+
+def read_index():
+    return {path: entry.oid for path, entry in read_index_entries().items()}
+
+# Forget the cached tree of every directory above `file_path`
+def invalidate_cache_tree(cache_tree, file_path):
+    if not cache_tree:
+        return
+    parts = file_path.split("/")
+    for depth in range(len(parts)):
+        cache_tree.pop("/".join(parts[:depth]), None)
 
-def write_index(data):
+# Without a cache tree (e.g. a merge writing a whole new index) every
+# directory is re-hashed on the next write_tree. Without an fsmonitor state
+# the next status or diff looks at the whole working tree; pass the loaded
+# one back only when no entry was changed in a way the file system never
+# saw (entries refreshed from a stat of the file are fine).
+@traced("index.write")
+def write_index(data, cache_tree=None, fsmonitor=None):
     path = index_path()
     os.makedirs(os.path.dirname(path), exist_ok=True)  # <- 🔧 Ensure directory
-    with open(path, 'w') as f:
-        json.dump(data, f)
+
+    # Entries modified in the same second the index is written are "racily
+    # clean": a later edit could keep the same mtime. Drop their size so the
+    # next stat comparison fails and the file gets re-hashed.
+    racy_ns = time.time_ns() // 1_000_000_000 * 1_000_000_000
+
+    parts = [_HEADER.pack(INDEX_SIGNATURE, INDEX_VERSION, len(data))]
+    for file_path in sorted(data):
+        entry = data[file_path]
+        if isinstance(entry, str):
+            entry = IndexEntry(entry)
+        size = 0 if entry.mtime_ns >= racy_ns else entry.size
+        name = file_path.encode("utf-8", "surrogateescape")
+        parts.append(_ENTRY.pack(entry.mtime_ns, entry.ctime_ns, size, entry.ino,
+                                 entry.mode, bytes.fromhex(entry.oid), len(name)))
+        parts.append(name)
+    if cache_tree:
+        payload = _serialize_cache_tree(cache_tree)
+        parts.append(_EXTENSION.pack(CACHE_TREE_SIGNATURE, len(payload)) + payload)
+    if fsmonitor is not None:
+        payload = _serialize_fsmonitor(fsmonitor)
+        parts.append(_EXTENSION.pack(FSMONITOR_SIGNATURE, len(payload)) + payload)
+    body = b"".join(parts)
+
+    # Write to a lock file and rename so readers never see a half-written index
+    lock_path = path + ".lock"
+    with open(lock_path, 'wb') as f:
+        f.write(body + hashlib.sha1(body).digest())
+    os.replace(lock_path, path)
+    count("syscall.open")
+    count("syscall.rename")
+    count("bytes.index_written", len(body) + 20)
 
 def add_to_index(file_path, oid):
     if not file_path or not isinstance(file_path, str) or not file_path.strip():
         raise TypeError("Invalid file path")
     if not oid or not isinstance(oid, str) or not oid.strip():
         raise TypeError("Invalid object ID")
-    index_data = read_index()
-    index_data[file_path] = oid
-    write_index(index_data)
+    index_data, cache_tree = load_index()
+    index_data[file_path] = IndexEntry(oid)
+    invalidate_cache_tree(cache_tree, file_path)
+    write_index(index_data, cache_tree)
+
+# Stage a batch of files with a single index read and a single index write.
+# Files whose stat data matches their index entry are not re-hashed; the
+# rest are hashed on up to `jobs` workers (see vctrl.ingest).
+# Returns (rel_path, oid) pairs in the order the paths were given.
+# `stats`, if given, holds a stat result per path (e.g. from a worktree
+# scan) so files are not stat'ed twice. Staged entries match their files,
+# so the fsmonitor state stays valid and is kept unless `fsmonitor`
+# replaces it.
+def add_many(paths, start=None, jobs=1, stats=None, fsmonitor=None):
+    from vctrl.ingest import hash_files
+
+    start = start or os.getcwd()
+    index_data, cache_tree = load_index()
+    fsmonitor = fsmonitor or load_fsmonitor_state()
+    rel_paths = []
+    dirty = []
+    for i, path in enumerate(paths):
+        rel_path = os.path.relpath(path, start)
+        st = stats[i] if stats is not None else os.stat(path)
+        entry = index_data.get(rel_path)
+        if entry is None or not entry.matches(st):
+            dirty.append((path, rel_path, st))
+        rel_paths.append(rel_path)
+
+    oids = hash_files([path for path, _, _ in dirty], jobs=jobs,
+                      sizes=[st.st_size for _, _, st in dirty])
+    for (_, rel_path, st), oid in zip(dirty, oids):
+        if rel_path not in index_data or index_data[rel_path].oid != oid:
+            invalidate_cache_tree(cache_tree, rel_path)
+        index_data[rel_path] = IndexEntry.from_stat(oid, st)
+
+    if rel_paths:
+        write_index(index_data, cache_tree, fsmonitor)
+    return [(rel_path, index_data[rel_path].oid) for rel_path in rel_paths]
 
 def clear_index():
     write_index({})
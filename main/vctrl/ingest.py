@@ -0,0 +1,96 @@
+import os
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from vctrl.objects import prepare_object, finish_object, hash_file
+from vctrl.repo import current_repository
+from vctrl.trace import count, traced
+
+# hashlib and zlib release the GIL on large buffers, so big files scale on
+# threads. Small files are dominated by interpreter overhead and are sent
+# to a process pool in batches instead.
+THREAD_MIN_SIZE = 1 << 20
+PROCESS_BATCH = 64
+# Below this many small files a process pool costs more than it saves
+PROCESS_MIN_FILES = 256
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+# Workers stream each file into a temp object and hand back (oid, temp path)
+# instead of the compressed bytes, so nothing large crosses the pool. Files
+# whose content is already stored come back as (oid, None).
+def _encode_file(path):
+    count("syscall.open")  # lost in process-pool workers, like their other counters
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        return prepare_object(f, size, type_="blob")
+
+
+# Workers don't share the caller's active repository (threads) or even its
+# cwd (spawned processes), so it is passed along with every batch
+def _encode_batch(paths, repo):
+    with repo:
+        return [_encode_file(path) for path in paths]
+
+
+# Split paths into contiguous work units: each large file on its own for
+# the thread pool, runs of small files batched together.
+def _plan(paths, sizes):
+    units, batch = [], []
+    for path, size in zip(paths, sizes):
+        if size >= THREAD_MIN_SIZE:
+            if batch:
+                units.append((False, batch))
+                batch = []
+            units.append((True, [path]))
+        else:
+            batch.append(path)
+            if len(batch) == PROCESS_BATCH:
+                units.append((False, batch))
+                batch = []
+    if batch:
+        units.append((False, batch))
+    return units
+
+
+# Hash and compress `paths` on up to `jobs` workers and write the resulting
+# blobs. Objects are published from the calling thread in path order, so
+# the store is filled deterministically whatever the pool does, and only a
+# bounded window of work is in flight.
+# Returns the oids in the same order as `paths`.
+@traced("add.hash")
+def hash_files(paths, jobs=1, sizes=None):
+    if jobs is None:
+        jobs = default_jobs()
+    if jobs <= 1 or len(paths) <= 1:
+        return [hash_file(path) for path in paths]
+
+    if sizes is None:
+        sizes = [os.stat(path).st_size for path in paths]
+    small_files = sum(1 for size in sizes if size < THREAD_MIN_SIZE)
+
+    repo = current_repository()
+    oids = []
+    window = deque()
+
+    def drain():
+        for oid, tmp_path in window.popleft().result():
+            oids.append(finish_object(oid, tmp_path))
+
+    with ExitStack() as stack:
+        threads = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+        processes = threads
+        if small_files >= PROCESS_MIN_FILES:
+            processes = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+
+        for on_thread, batch in _plan(paths, sizes):
+            pool = threads if on_thread else processes
+            window.append(pool.submit(_encode_batch, batch, repo))
+            if len(window) >= jobs * 4:
+                drain()
+        while window:
+            drain()
+    return oids
@@ -0,0 +1,276 @@
+# Line-level diffing: Myers' O(ND) algorithm in linear space, and unified
+# diff output.
+#
+# diff_lines() returns difflib-style opcodes, (tag, i1, i2, j1, j2) with tag
+# one of "equal", "delete", "insert" or "replace", so callers (unified
+# diffs here, three-way merges elsewhere) can walk both sides in step.
+
+
+# Past this many edits in one subproblem the search stops looking for the
+# shortest script and splits at the point that got furthest, as git does,
+# so unrelated inputs cost O((N + M) * MAX_COST) instead of O(N * D).
+MAX_COST = 256
+
+
+def _myers(a, b):
+    # Matching blocks (i, j, length) of a shortest edit script between a
+    # and b, using the linear-space variant of Myers' algorithm: find the
+    # middle of the path with a search from both ends, split there, repeat.
+    # Lines are interned to ints first, and lines that only one side has
+    # (which can never match) are dropped before searching.
+    ids = {}
+    ia = [ids.setdefault(line, len(ids)) for line in a]
+    ib = [ids.setdefault(line, len(ids)) for line in b]
+    in_a, in_b = set(ia), set(ib)
+    keep_a = [i for i, line in enumerate(ia) if line in in_b]
+    keep_b = [j for j, line in enumerate(ib) if line in in_a]
+    fa = [ia[i] for i in keep_a]
+    fb = [ib[j] for j in keep_b]
+
+    matched = []
+    stack = [(0, len(fa), 0, len(fb))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and fa[alo] == fb[blo]:
+            matched.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and fa[ahi - 1] == fb[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matched.append((ahi, bhi))
+        if alo < ahi and blo < bhi:
+            x, y = _bisect(fa, fb, alo, ahi, blo, bhi)
+            stack.append((alo, alo + x, blo, blo + y))
+            stack.append((alo + x, ahi, blo + y, bhi))
+
+    # Back to positions in a and b; lines dropped in between break a run
+    blocks = []
+    for i, j in sorted(matched):
+        i, j = keep_a[i], keep_b[j]
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1][2] += 1
+        else:
+            blocks.append([i, j, 1])
+    return [tuple(block) for block in blocks]
+
+
+# Where the edit script of a[alo:ahi] and b[blo:bhi] (which differ in their
+# first and last lines) crosses the middle, as (x, y) relative to alo and
+# blo. Forward and reverse searches run in turns (v1 and v2 hold the
+# furthest x reached on each diagonal) until they overlap.
+def _bisect(a, b, alo, ahi, blo, bhi):
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    v1 = [-1] * (2 * max_d + 2)
+    v2 = [-1] * (2 * max_d + 2)
+    v1[offset + 1] = v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    best = (0, 0, 0)  # furthest forward point (x + y, x, y), for the cutoff
+    for d in range(min(max_d, MAX_COST)):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2  # ran off the right edge
+            elif y1 > m:
+                k1start += 2  # ran off the bottom edge
+            else:
+                if x1 + y1 > best[0]:
+                    best = (x1 + y1, x1, y1)
+                if front:
+                    k2_offset = offset + delta - k1
+                    if 0 <= k2_offset < len(v2) and v2[k2_offset] != -1 and x1 >= n - v2[k2_offset]:
+                        return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < len(v1) and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= n - x2:
+                        return x1, offset + x1 - k1_offset
+    # Too expensive: settle for the furthest point the forward search reached
+    _, x, y = best
+    if x + y == 0:
+        return (1, 0) if n else (0, 1)
+    return x, y
+
+
+def diff_lines(a, b):
+    # Common prefixes and suffixes are cheap to strip and usually make up
+    # most of a file, so Myers only runs on the middle.
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    blocks = []
+    if prefix:
+        blocks.append((0, 0, prefix))
+    for i, j, size in _myers(a[prefix:len(a) - suffix], b[prefix:len(b) - suffix]):
+        blocks.append((i + prefix, j + prefix, size))
+    if suffix:
+        blocks.append((len(a) - suffix, len(b) - suffix, suffix))
+
+    opcodes = []
+    i = j = 0
+    for bi, bj, size in blocks + [(len(a), len(b), 0)]:
+        if i < bi and j < bj:
+            opcodes.append(("replace", i, bi, j, bj))
+        elif i < bi:
+            opcodes.append(("delete", i, bi, j, j))
+        elif j < bj:
+            opcodes.append(("insert", i, i, j, bj))
+        if size:
+            opcodes.append(("equal", bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return opcodes
+
+
+# Group opcodes into hunks with `context` lines of surrounding context,
+# the same way difflib groups them
+def _hunks(opcodes, context):
+    if not opcodes:
+        return
+    codes = list(opcodes)
+    tag, i1, i2, j1, j2 = codes[0]
+    if tag == "equal":
+        codes[0] = (tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2)
+    tag, i1, i2, j1, j2 = codes[-1]
+    if tag == "equal":
+        codes[-1] = (tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context))
+
+    hunk = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > 2 * context:
+            hunk.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield hunk
+            hunk = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        hunk.append((tag, i1, i2, j1, j2))
+    if hunk and not (len(hunk) == 1 and hunk[0][0] == "equal"):
+        yield hunk
+
+
+def _range(start, length):
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1 if length else start},{length}"
+
+
+# Yield a unified diff of two lists of lines (each ending in "\n", except
+# possibly the last) one output line at a time.
+def unified_diff(a, b, a_name="a", b_name="b", context=3):
+    started = False
+    for hunk in _hunks(diff_lines(a, b), context):
+        if not started:
+            yield f"--- {a_name}\n"
+            yield f"+++ {b_name}\n"
+            started = True
+        first, last = hunk[0], hunk[-1]
+        yield f"@@ -{_range(first[1], last[2] - first[1])} +{_range(first[3], last[4] - first[3])} @@\n"
+        for tag, i1, i2, j1, j2 in hunk:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield _terminated(" " + line)
+                continue
+            for line in a[i1:i2]:
+                yield _terminated("-" + line)
+            for line in b[j1:j2]:
+                yield _terminated("+" + line)
+
+
+def _terminated(line):
+    if line.endswith("\n"):
+        return line
+    return line + "\n\\ No newline at end of file\n"
+
+
+def _changes(base, side):
+    return [(i1, i2, j1, j2) for tag, i1, i2, j1, j2 in diff_lines(base, side) if tag != "equal"]
+
+
+def _marker(marker, label):
+    return f"{marker} {label}\n" if label else f"{marker}\n"
+
+
+# Three-way merge of lists of lines. Each side is diffed against the base;
+# changes from the two sides that overlap (or touch) in the base are grouped
+# into one region. A region changed on one side only, or changed the same
+# way on both, is taken as is; anything else becomes a conflict block.
+# Returns (merged lines, number of conflicts).
+def merge3(base, ours, theirs, ours_label="ours", theirs_label="theirs"):
+    changes = sorted([(c[0], c[1], 0, c) for c in _changes(base, ours)] +
+                     [(c[0], c[1], 1, c) for c in _changes(base, theirs)])
+    sides = (ours, theirs)
+    delta = [0, 0]  # line count difference between each side and base so far
+    merged = []
+    conflicts = 0
+    pos = 0
+    i = 0
+    while i < len(changes):
+        start, end = changes[i][0], changes[i][1]
+        group = [changes[i]]
+        i += 1
+        while i < len(changes) and changes[i][0] <= end:
+            end = max(end, changes[i][1])
+            group.append(changes[i])
+            i += 1
+
+        merged.extend(base[pos:start])
+        pos = end
+        touched = {side for _, _, side, _ in group}
+        chunks = []
+        for side in (0, 1):
+            growth = sum((j2 - j1) - (i2 - i1) for _, _, s, (i1, i2, j1, j2) in group if s == side)
+            first = start + delta[side]
+            chunks.append(sides[side][first:end + delta[side] + growth])
+            delta[side] += growth
+
+        if len(touched) == 1:
+            merged.extend(chunks[touched.pop()])
+        elif chunks[0] == chunks[1]:
+            merged.extend(chunks[0])
+        else:
+            conflicts += 1
+            merged.append(_marker("<<<<<<<", ours_label))
+            merged.extend(_terminated_lines(chunks[0]))
+            merged.append("=======\n")
+            merged.extend(_terminated_lines(chunks[1]))
+            merged.append(_marker(">>>>>>>", theirs_label))
+    merged.extend(base[pos:])
+    return merged, conflicts
+
+
+def _terminated_lines(lines):
+    if lines and not lines[-1].endswith("\n"):
+        return lines[:-1] + [lines[-1] + "\n"]
+    return lines
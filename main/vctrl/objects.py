@@ -1,5 +1,9 @@
-import os, hashlib, zlib
-from vctrl.repo import repo_path
+import os, io, re, hashlib, zlib, tempfile
+from vctrl.repo import current_repository
+from vctrl.worktree import scan
+from vctrl import pack
+from vctrl.cache import object_cache
+from vctrl.trace import count, traced
 
 
 class GitObject:
@@ -8,11 +12,31 @@ class GitObject:
         self.oid = oid
         self.type = type_
         self.data = data
+
+    # `data` may be filled in on first access when the object was opened lazily
+    @property
+    def data(self):
+        if self._loader is not None:
+            self._data = self._loader()
+            self._loader = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._loader = None
     
     @classmethod
-    def from_file(cls, oid, expected_type=None):
-        content = read_object(oid, expected_type)
-        obj = cls(oid=oid, type_=expected_type, data=content)
+    def from_file(cls, oid, expected_type=None, lazy=False):
+        if not lazy:
+            content = read_object(oid, expected_type)
+            return cls(oid=oid, type_=expected_type, data=content)
+
+        # Only check that the object exists now; inflate it when .data is read
+        if not object_exists(oid):
+            raise FileNotFoundError(f"Object not found: {oid}")
+        obj = cls(oid=oid, type_=expected_type)
+        obj._loader = lambda: read_object(oid, expected_type)
         return obj
     
     def save(self):
@@ -41,46 +65,134 @@ class Tree(GitObject):
         data = self._serialize_entries() if entries else None
         super().__init__(oid=oid, type_="tree", data=data)
     
+    # Binary format, one entry after another: "<mode> <name>\0<20-byte oid>".
+    # Names may contain spaces and newlines; only NUL is off limits.
     def _serialize_entries(self):
         if not self.entries:
             return b""
-        tree_content = "\n".join(f"{type_} {oid} {name}" for type_, oid, name in self.entries)
-        return tree_content.encode()
+        return b"".join(
+            TYPE_MODES[type_] + b" " + name.encode("utf-8", "surrogateescape") + b"\0" + bytes.fromhex(oid)
+            for type_, oid, name in self.entries)
     
     def add_entry(self, type_, oid, name):
         self.entries.append((type_, oid, name))
         self.data = self._serialize_entries()
     
+    # Files whose stat data matches their index entry reuse the cached oid
+    # instead of being hashed again. The directory is read with the shared
+    # worktree scanner, so ignored paths are skipped and ignored
+    # directories never entered.
     @classmethod
-    def from_directory(cls, directory='.'):
-        entries = []
+    def from_directory(cls, directory='.', index_entries=None):
+        if index_entries is None:
+            index_entries = load_index()[0]
 
-        for entry in sorted(os.listdir(directory)):
-            if entry.startswith('.') or entry in {'__pycache__', 'build', 'dist', 'venv'}:
-                continue  # Skip hidden and system files like .DS_Store
+        root = {}
+        for rel_path, st in scan(directory):
+            path = os.path.join(directory, rel_path)
+            cached = index_entries.get(os.path.relpath(path).replace(os.sep, "/"))
+            oid = cached.oid if cached is not None and cached.matches(st) else hash_file(path)
+            *dirs, name = rel_path.split("/")
+            node = root
+            for part in dirs:
+                node = node.setdefault(part, {})
+            node[name] = oid
 
-            path = os.path.join(directory, entry)
+        def build(node):
+            entries = []
+            # git's order: a directory sorts as if its name ended in "/"
+            for name in sorted(node, key=lambda n: n + "/" if isinstance(node[n], dict) else n):
+                child = node[name]
+                if isinstance(child, dict):
+                    entries.append(("tree", build(child).save(), name))
+                else:
+                    entries.append(("blob", child, name))
+            return cls(entries=entries)
 
-            if os.path.isfile(path):
-                blob = Blob.from_file_path(path)
-                oid = blob.save()
-                entries.append(("blob", oid, entry))
+        return build(root)
 
-            elif os.path.isdir(path):
-                subtree = cls.from_directory(path)
-                if subtree.entries:  # Only add non-empty subtrees
-                    oid = subtree.save()
-                    entries.append(("tree", oid, entry))
-    
-        return cls(entries=entries)
+
+TYPE_MODES = {"blob": b"100644", "tree": b"40000"}
+MODE_TYPES = {b"100644": "blob", b"100755": "blob", b"40000": "tree"}
+
+# Tree format versions. Version 1 trees are "type oid name" text lines and
+# were written before the binary format; they are still read so existing
+# history stays accessible. A v1 tree always starts with "blob " or "tree ",
+# a v2 tree with a numeric mode, so the version is known from the first bytes.
+TREE_FORMAT_TEXT = 1
+TREE_FORMAT_BINARY = 2
+
+_BINARY_TREE_ENTRY = re.compile(rb"(\d+) ([^\0]*)\0(.{20})", re.S)
+_BINARY_TREE = re.compile(rb"(?:\d+ [^\0]*\0.{20})*", re.S)
+
+
+# A tree entry is the (mode, raw name, raw 20-byte oid) triple found in the
+# tree itself; the name is decoded and the oid turned into hex only when
+# asked for, so parsing a tree allocates one tuple per entry and callers
+# pay for the fields they actually read.
+class TreeEntry(tuple):
+    __slots__ = ()
+
+    @property
+    def mode(self):
+        return self[0]
+
+    @property
+    def name(self):
+        return self[1].decode("utf-8", "surrogateescape")
+
+    @property
+    def oid(self):
+        return self[2].hex()
+
+    @property
+    def type(self):
+        return MODE_TYPES[self[0]]
+
+    def __repr__(self):
+        return f"TreeEntry({self.mode!r}, {self.name!r}, {self.oid!r})"
+
+
+def tree_format(data):
+    if data[:5] in (b"blob ", b"tree "):
+        return TREE_FORMAT_TEXT
+    return TREE_FORMAT_BINARY
+
+
+def _parse_text_tree(data):
+    entries = []
+    for entry in data.splitlines():
+        parts = entry.split()
+        if len(parts) != 3:
+            raise ValueError(f"Malformed tree entry: {entry.decode(errors='replace')}")
+        type_, oid, name = parts
+        entries.append(TreeEntry((TYPE_MODES[type_.decode()], name, bytes.fromhex(oid.decode()))))
+    return entries
+
+
+def parse_tree(data):
+    if tree_format(data) == TREE_FORMAT_TEXT:
+        return _parse_text_tree(data)
+
+    # Two C-level scans over the buffer (bytes or memoryview): one checks
+    # that it is nothing but entries, the other yields their (mode, name,
+    # raw oid) triples, which become entries as they are
+    if _BINARY_TREE.fullmatch(data) is None:
+        raise ValueError("Malformed tree: trailing or truncated entry")
+    return list(map(TreeEntry, _BINARY_TREE_ENTRY.findall(data)))
 
 
 class Commit(GitObject):
     
     def __init__(self, tree_oid, parent=None, message="", author_name="you", 
-                 author_email="notknown", oid=None):
+                 author_email="notknown", oid=None, parents=None):
         self.tree_oid = tree_oid
-        self.parent = parent
+        # `parents` lists every parent (two for a merge); `parent` is the
+        # single-parent shorthand
+        if parents is None:
+            parents = [parent] if parent else []
+        self.parents = list(parents)
+        self.parent = self.parents[0] if self.parents else None
         self.message = message
         self.author_name = author_name
         self.author_email = author_email
@@ -95,37 +207,263 @@ class Commit(GitObject):
             raise ValueError("Cannot create a commit with no tree")
         
         commit = f"tree {self.tree_oid}\n"
-        if self.parent:
-            commit += f"parent {self.parent}\n"
+        for parent in self.parents:
+            commit += f"parent {parent}\n"
         commit += f"author {self.author_name} <{self.author_email}> {int(time.time())} +0000\n"
         commit += f'\n{self.message}\n'
         
         return commit.encode()
 
 
-def hash_object(data, type_="blob"):
+class CommitInfo:
+    __slots__ = ("oid", "tree", "parents", "author", "timestamp", "message")
+
+    def __init__(self, oid, tree, parents, author, timestamp, message):
+        self.oid = oid
+        self.tree = tree
+        self.parents = parents
+        self.author = author
+        self.timestamp = timestamp
+        self.message = message
+
+    @property
+    def parent(self):
+        return self.parents[0] if self.parents else None
+
+
+def parse_commit(oid, data):
+    headers, _, message = data.decode().partition("\n\n")
+    tree = None
+    parents = []
+    author = ""
+    timestamp = 0
+    for line in headers.splitlines():
+        key, _, value = line.partition(" ")
+        if key == "tree":
+            tree = value
+        elif key == "parent":
+            parents.append(value)
+        elif key == "author":
+            author, timestamp, _ = value.rsplit(" ", 2)
+            timestamp = int(timestamp)
+    return CommitInfo(oid, tree, tuple(parents), author, timestamp, message.rstrip("\n"))
+
+
+# Files are hashed and inflated in chunks of this size so memory use does
+# not grow with the object
+CHUNK_SIZE = 1 << 16
+
+
+def encode_object(data, type_="blob"):
     header = f"{type_} {len(data)}\0".encode()
     full_data = header + data
     oid = hashlib.sha1(full_data).hexdigest()
-   
-    object_dir = os.path.join(repo_path(), "objects")
+    return oid, zlib.compress(full_data)
 
-    if not os.path.isdir(object_dir):
-        raise FileNotFoundError(f"Object directory not found: {object_dir}")
-    
-    path = os.path.join(object_dir, oid)
-    
-    with open(path, "wb") as f:
-        f.write(zlib.compress(full_data))
 
-    return oid 
+# Loose objects live in a git-style fan-out, objects/<2 hex>/<38 hex>, so
+# no single directory grows to hold every object in the repository
+_fanout_ready = set()  # object dirs already migrated to the fan-out layout
 
 
-def get_object(oid, expected_type=None):
-    path = os.path.join(repo_path(), "objects", oid)
+def object_dir():
+    directory = current_repository().objects_dir
+    if directory not in _fanout_ready:
+        _migrate_flat_objects(directory)
+        _fanout_ready.add(directory)
+    return directory
+
+
+# Repositories written before the fan-out layout keep objects directly in
+# objects/<oid>. They are moved once; the marker file spares later runs the
+# directory scan.
+def _migrate_flat_objects(directory):
+    marker = os.path.join(directory, "info", "fanout")
+    if os.path.exists(marker) or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if not _is_oid(name):
+            continue
+        os.makedirs(os.path.join(directory, name[:2]), exist_ok=True)
+        try:
+            os.replace(os.path.join(directory, name), os.path.join(directory, name[:2], name[2:]))
+        except FileNotFoundError:
+            pass  # moved by a concurrent migration
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    open(marker, "w").close()
+
+
+def loose_path(oid):
+    return os.path.join(object_dir(), oid[:2], oid[2:])
+
+
+def _publish(tmp_path, oid):
+    path = loose_path(oid)
+    try:
+        os.replace(tmp_path, path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)  # first object in this fan-out dir
+        os.replace(tmp_path, path)
+
+
+# Write through a temp file and a rename so a crash never leaves a
+# truncated object under its final name
+def write_object(oid, compressed):
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=object_dir())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(compressed)
+        _publish(tmp_path, oid)
+        count("objects.written")
+        count("bytes.deflated", len(compressed))
+        count("syscall.open")
+        count("syscall.rename")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return oid
+
+
+# Objects are content-addressed, so one that already exists (loose or
+# packed) is never compressed or written again
+def hash_object(data, type_="blob"):
+    header = f"{type_} {len(data)}\0".encode()
+    oid = hashlib.sha1(header + data).hexdigest()
+    if object_exists(oid):
+        count("objects.write_skipped")
+        return oid
+    return write_object(oid, zlib.compress(header + data))
+
+
+# Hash and deflate `size` bytes read from `f` into a temp file inside the
+# object directory. Returns (oid, temp_path); the caller publishes the
+# object with finish_object() once it decides to keep it.
+def stream_object(f, size, type_="blob"):
+    header = f"{type_} {size}\0".encode()
+    sha = hashlib.sha1(header)
+    deflate = zlib.compressobj()
+
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=object_dir())
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(deflate.compress(header))
+            deflated = 0
+            remaining = size
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("File shrank while it was being hashed")
+                remaining -= len(chunk)
+                sha.update(chunk)
+                compressed = deflate.compress(chunk)
+                deflated += len(compressed)
+                out.write(compressed)
+            compressed = deflate.flush()
+            deflated += len(compressed)
+            out.write(compressed)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    count("bytes.deflated", deflated)
+    count("syscall.open")
+    return sha.hexdigest(), tmp_path
+
+
+def _stream_oid(f, size, type_):
+    sha = hashlib.sha1(f"{type_} {size}\0".encode())
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        sha.update(chunk)
+    return sha.hexdigest()
+
 
-    with open(path, "rb") as file:
+# Hash `f` first and only deflate it into a temp object if that oid is not
+# stored yet: hashing is far cheaper than compressing, and re-adding known
+# content is the common case. Returns (oid, temp_path or None).
+def prepare_object(f, size, type_="blob"):
+    oid = _stream_oid(f, size, type_)
+    if object_exists(oid):
+        count("objects.write_skipped")
+        return oid, None
+    f.seek(0)
+    return stream_object(f, size, type_)
+
+
+def finish_object(oid, tmp_path):
+    if tmp_path is None:
+        return oid
+    if os.path.exists(loose_path(oid)):
+        os.unlink(tmp_path)  # written by someone else in the meantime
+        return oid
+    _publish(tmp_path, oid)
+    count("objects.written")
+    count("syscall.rename")
+    return oid
+
+
+# Streaming counterpart of hash_object: peak memory stays at a few chunks
+# no matter how large the file is. With write=False the oid is only
+# computed and nothing touches the object store.
+def hash_file(path, type_="blob", write=True):
+    count("syscall.open")
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not write:
+            return _stream_oid(f, size, type_)
+        oid, tmp_path = prepare_object(f, size, type_)
+    return finish_object(oid, tmp_path)
+
+
+def _is_hex(name):
+    return all(c in "0123456789abcdef" for c in name)
+
+
+def _is_oid(name):
+    return len(name) == 40 and _is_hex(name)
+
+
+# Also safe for user input such as a branch name that isn't one: anything
+# but 40 hex digits is not an oid (and must not reach a pack index lookup
+# or be joined into a path)
+def object_exists(oid):
+    if not _is_oid(oid):
+        return False
+    count("syscall.stat")
+    return os.path.exists(loose_path(oid)) or pack.is_packed(oid)
+
+
+def iter_loose_objects():
+    directory = object_dir()
+    for prefix in os.listdir(directory):
+        if len(prefix) != 2 or not _is_hex(prefix):
+            continue
+        subdir = os.path.join(directory, prefix)
+        for name in os.listdir(subdir):
+            if _is_oid(prefix + name):
+                yield prefix + name, os.path.join(subdir, name)
+
+
+# Returns (type, content) for any object, packed or loose
+def load_object(oid):
+    cached = object_cache.get(oid)
+    if cached is not None:
+        count("objects.cache_hit")
+        return cached
+
+    # Packs first: one binary search in an already-open index instead of
+    # an open() per object. Loose objects are the fallback.
+    packed = pack.find_object(oid)
+    if packed is not None:
+        count("objects.read")
+        count("objects.read_packed")
+        object_cache.put(oid, packed, len(packed[1]))
+        return packed
+
+    with open(loose_path(oid), "rb") as file:
         data = zlib.decompress(file.read())
+    count("objects.read")
+    count("syscall.open")
+    count("bytes.inflated", len(data))
     
     null_sep = data.index(b'\0')
 
@@ -135,21 +473,203 @@ def get_object(oid, expected_type=None):
 
     content = data[null_sep+1:]
     assert len(content) == size
+    object_cache.put(oid, (type_, content), len(content))
+    return type_, content
+
+
+def get_object(oid, expected_type=None):
+    type_, content = load_object(oid)
     if expected_type: 
         assert expected_type == type_
     
     return content 
 
 
+# Streaming counterpart of get_object: inflates the object a chunk at a time.
+#
+#     with open_object(oid) as obj:
+#         for chunk in obj:
+#             out.write(chunk)
+class ObjectReader:
+
+    def __init__(self, oid, expected_type=None):
+        self.oid = oid
+        self._file = open(loose_path(oid), "rb")
+        count("objects.read")
+        count("syscall.open")
+        self._inflate = zlib.decompressobj()
+        self._buffer = b""
+        self._eof = False
+        self._remaining = None
+
+        try:
+            while b"\0" not in self._buffer and not self._eof:
+                self._fill()
+            null_sep = self._buffer.index(b"\0")
+            self.type, size = self._buffer[:null_sep].decode().split()
+            self.size = int(size)
+        except BaseException:
+            self.close()
+            raise
+        self._buffer = self._buffer[null_sep+1:]
+        self._remaining = self.size
+        if expected_type:
+            assert expected_type == self.type
+
+    def _fill(self):
+        data = self._inflate.unconsumed_tail
+        if not data:
+            data = self._file.read(CHUNK_SIZE)
+            if not data:
+                self._buffer += self._inflate.flush()
+                self._eof = True
+                return
+        inflated = self._inflate.decompress(data, CHUNK_SIZE)
+        count("bytes.inflated", len(inflated))
+        self._buffer += inflated
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self._remaining
+        while len(self._buffer) < n and not self._eof:
+            self._fill()
+        chunk, self._buffer = self._buffer[:n], self._buffer[n:]
+        self._remaining -= len(chunk)
+        if len(chunk) < n:
+            assert self._remaining == 0, f"Truncated object {self.oid}"
+        return chunk
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Packed objects may be deltas, so they are rebuilt in memory and served
+# from a buffer with the same interface as ObjectReader.
+class PackedObjectReader(io.BytesIO):
+
+    def __init__(self, oid, type_, data):
+        super().__init__(data)
+        self.oid = oid
+        self.type = type_
+        self.size = len(data)
+
+    def __iter__(self):
+        return iter(lambda: self.read(CHUNK_SIZE), b"")
+
+
+def open_object(oid, expected_type=None):
+    packed = pack.find_object(oid)
+    if packed is None:
+        return ObjectReader(oid, expected_type)
+    type_, data = packed
+    if expected_type:
+        assert expected_type == type_
+    return PackedObjectReader(oid, type_, data)
+
+
 def read_object(oid, expected_type=None):
     return get_object(oid, expected_type)
 
-from vctrl.index import read_index
 
+# Parsed trees and commits are cached next to the raw content. Their cost
+# is charged at twice the raw size to roughly cover the Python objects.
+def read_tree(oid):
+    key = ("tree", oid)
+    entries = object_cache.get(key)
+    if entries is None:
+        data = get_object(oid, expected_type="tree")
+        entries = tuple(parse_tree(data))
+        object_cache.put(key, entries, 2 * len(data))
+    return entries
+
+
+def read_commit(oid):
+    key = ("commit", oid)
+    commit = object_cache.get(key)
+    if commit is None:
+        data = get_object(oid, expected_type="commit")
+        commit = parse_commit(oid, data)
+        object_cache.put(key, commit, 2 * len(data))
+    return commit
+
+from vctrl.index import load_index, load_fsmonitor_state, write_index
+
+
+# Trees committed before directories were nested are flat: one entry per
+# file, named by its whole path ("sub/b.txt"). Code that walks trees level
+# by level must compare flattened paths for those instead.
+def is_flat_tree(entries):
+    return any("/" in entry.name for entry in entries)
+
+
+# Recursively list a tree as {path: blob oid}. If `dirs` is given it is
+# filled with {directory path: tree oid}, in the shape of the index's
+# cache tree ("" is the root).
+def flatten_tree(tree_oid, prefix="", dirs=None):
+    files = {}
+    if dirs is not None:
+        dirs[prefix.rstrip("/")] = tree_oid
+    for entry in read_tree(tree_oid):
+        path = prefix + entry.name
+        if entry.type == "tree":
+            files.update(flatten_tree(entry.oid, path + "/", dirs))
+        else:
+            files[path] = entry.oid
+    return files
+
+
+# Build nested tree objects from the index. Directories whose oid is still
+# in the index's cache tree are reused as-is, so only the directories on the
+# path to a changed file are serialized and hashed again.
+@traced("tree.write")
 def write_tree():
-    entries = []
-    index = read_index()
-    for path, oid in index.items():
-        entries.append(("blob", oid, path))
-    tree = Tree(entries=entries)
-    return tree.save()
+    entries, cache_tree = load_index()
+    if not entries:
+        return None
+
+    root = {}
+    for path, entry in entries.items():
+        *dirs, name = path.split("/")
+        node = root
+        for part in dirs:
+            node = node.setdefault(part, {})
+        node[name] = entry.oid
+
+    updated = False
+
+    def build(node, dir_path):
+        nonlocal updated
+        oid = cache_tree.get(dir_path)
+        if oid:
+            return oid
+        tree_entries = []
+        # git's order: a directory sorts as if its name ended in "/"
+        for name in sorted(node, key=lambda n: n + "/" if isinstance(node[n], dict) else n):
+            child = node[name]
+            if isinstance(child, dict):
+                child_path = f"{dir_path}/{name}" if dir_path else name
+                tree_entries.append(("tree", build(child, child_path), name))
+            else:
+                tree_entries.append(("blob", child, name))
+        oid = Tree(entries=tree_entries).save()
+        cache_tree[dir_path] = oid
+        updated = True
+        return oid
+
+    tree_oid = build(root, "")
+    if updated:
+        write_index(entries, cache_tree, load_fsmonitor_state())
+    return tree_oid
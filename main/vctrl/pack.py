@@ -0,0 +1,483 @@
+import os, mmap, bisect, struct, zlib, hashlib, tempfile
+from vctrl.repo import current_repository
+from vctrl.cache import object_cache
+from vctrl.trace import count
+
+# Pack file (objects/pack/pack-<sha>.pack):
+#   header   "PACK" | u32 version | u32 object count
+#   objects  type/size varint header, [base distance for deltas], zlib data
+#   trailer  SHA-1 of everything above
+#
+# Pack index (objects/pack/pack-<sha>.idx):
+#   header   "VPIX" | u32 version
+#   fanout   256 x u32, entry i = number of oids whose first byte <= i
+#   oids     count x 20 raw bytes, sorted
+#   offsets  count x u64 offset of each object in the pack
+#   trailer  pack SHA-1 | SHA-1 of everything above
+#
+# Deltas use git's copy/insert instruction encoding and always point back
+# at a base that was written earlier in the same pack (an "ofs-delta").
+PACK_SIGNATURE = b"PACK"
+IDX_SIGNATURE = b"VPIX"
+PACK_VERSION = 2
+
+OBJ_COMMIT, OBJ_TREE, OBJ_BLOB, OBJ_OFS_DELTA = 1, 2, 3, 6
+TYPE_CODES = {"commit": OBJ_COMMIT, "tree": OBJ_TREE, "blob": OBJ_BLOB}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+DELTA_WINDOW = 10
+MAX_DELTA_DEPTH = 50
+MAX_DELTA_SOURCE = 16 << 20  # objects larger than this are stored whole
+MIN_COPY = 8  # shorter matches cost more as a copy than as an insert
+READ_CHUNK = 1 << 16
+USE_MMAP = True  # set to False to read packs with plain pread
+
+_IDX_HEADER = struct.Struct(">4sI")
+_FANOUT = struct.Struct(">256I")
+_OFFSET = struct.Struct(">Q")
+
+
+def pack_dir():
+    return current_repository().pack_dir
+
+
+# --- deltas -----------------------------------------------------------------
+
+def _encode_varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if not n:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def _decode_varint(buf, pos):
+    n = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return n, pos
+
+
+def _copy_op(offset, size):
+    op = 0x80
+    args = bytearray()
+    for i in range(4):
+        byte = (offset >> (8 * i)) & 0xff
+        if byte:
+            op |= 1 << i
+            args.append(byte)
+    for i in range(3):
+        byte = (size >> (8 * i)) & 0xff
+        if byte:
+            op |= 0x10 << i
+            args.append(byte)
+    return bytes([op]) + bytes(args)
+
+
+# Build a delta that rebuilds `target` from `base`. Matching is done a line
+# at a time, which is cheap in Python and finds the shared runs that
+# matter for source files; binary blobs mostly end up as plain inserts.
+def create_delta(base, target):
+    base_lines = base.splitlines(keepends=True)
+    base_offsets = []
+    first_seen = {}
+    offset = 0
+    for number, line in enumerate(base_lines):
+        base_offsets.append(offset)
+        first_seen.setdefault(line, number)
+        offset += len(line)
+
+    out = bytearray(_encode_varint(len(base)) + _encode_varint(len(target)))
+    pending = bytearray()
+
+    def flush_inserts():
+        for start in range(0, len(pending), 127):
+            chunk = pending[start:start + 127]
+            out.append(len(chunk))
+            out.extend(chunk)
+        pending.clear()
+
+    target_lines = target.splitlines(keepends=True)
+    i = 0
+    while i < len(target_lines):
+        j = first_seen.get(target_lines[i])
+        if j is not None:
+            k = length = 0
+            while i + k < len(target_lines) and j + k < len(base_lines) \
+                    and target_lines[i + k] == base_lines[j + k]:
+                length += len(target_lines[i + k])
+                k += 1
+            if length >= MIN_COPY:
+                flush_inserts()
+                start = base_offsets[j]
+                while length:
+                    size = min(length, 0xffffff)
+                    out.extend(_copy_op(start, size))
+                    start += size
+                    length -= size
+                i += k
+                continue
+        pending.extend(target_lines[i])
+        i += 1
+    flush_inserts()
+    return bytes(out)
+
+
+def apply_delta(base, delta):
+    base_size, pos = _decode_varint(delta, 0)
+    target_size, pos = _decode_varint(delta, pos)
+    if base_size != len(base):
+        raise ValueError("Delta base size mismatch")
+
+    out = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            size = size or 0x10000
+            out += base[offset:offset + size]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError("Invalid delta opcode 0")
+
+    if len(out) != target_size:
+        raise ValueError("Delta target size mismatch")
+    return bytes(out)
+
+
+# --- reading ----------------------------------------------------------------
+
+class PackFile:
+
+    def __init__(self, idx_path, use_mmap=None):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-len(".idx")] + ".pack"
+        self.use_mmap = USE_MMAP if use_mmap is None else use_mmap
+
+        # With mmap the index and pack are mapped once per process and every
+        # lookup works on the mapped pages: oids and offsets are read in
+        # place and entries are inflated straight from a memoryview slice.
+        with open(idx_path, "rb") as f:
+            if self.use_mmap:
+                idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                idx = f.read()
+        signature, version = _IDX_HEADER.unpack_from(idx, 0)
+        if signature != IDX_SIGNATURE or version != PACK_VERSION:
+            raise ValueError(f"Unsupported pack index: {idx_path}")
+
+        self._fanout = _FANOUT.unpack_from(idx, _IDX_HEADER.size)
+        self.count = self._fanout[255]
+        self._oids_start = _IDX_HEADER.size + _FANOUT.size
+        self._offsets_start = self._oids_start + 20 * self.count
+        if len(idx) != self._offsets_start + 8 * self.count + 40:
+            raise ValueError(f"Corrupt pack index: {idx_path}")
+        self._idx = idx
+        # Hashing the whole index would undo the point of mapping it, so
+        # mapped indexes are only checked by verify() (gc does that)
+        if not self.use_mmap:
+            self.verify()
+        self.checksum = bytes(idx[-40:-20])
+        self._ends = None
+
+        self._file = open(self.pack_path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        if self.use_mmap:
+            self._pack = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._pack)
+
+    # The index trailer ends with the SHA-1 of everything before it; a
+    # corrupt index would otherwise hand out wrong offsets
+    def verify(self):
+        if hashlib.sha1(self._idx[:-20]).digest() != self._idx[-20:]:
+            raise ValueError(f"Corrupt pack index: {self.idx_path}")
+
+    def close(self):
+        if self.use_mmap:
+            self._view.release()
+            self._pack.close()
+            self._idx.close()
+        self._file.close()
+
+    def _oid_at(self, i):
+        start = self._oids_start + 20 * i
+        return self._idx[start:start + 20]
+
+    def _offset_at(self, i):
+        return _OFFSET.unpack_from(self._idx, self._offsets_start + 8 * i)[0]
+
+    def find(self, oid):
+        key = bytes.fromhex(oid)
+        first = key[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = self._oid_at(mid)
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return self._offset_at(mid)
+        return None
+
+    def __contains__(self, oid):
+        return self.find(oid) is not None
+
+    def oids(self):
+        for i in range(self.count):
+            yield self._oid_at(i).hex()
+
+    # Entries are stored back to back, so an entry ends where the next one
+    # (in offset order) starts. Knowing the exact compressed length lets us
+    # inflate a single slice with no over-read.
+    def _entry_end(self, offset):
+        if self._ends is None:
+            self._ends = sorted(self._offset_at(i) for i in range(self.count))
+            self._ends.append(self.size - 20)
+        return self._ends[bisect.bisect_right(self._ends, offset)]
+
+    def _read_entry(self, offset):
+        if self.use_mmap:
+            buf, pos = self._pack, offset
+        else:
+            buf, pos = os.pread(self._file.fileno(), 32, offset), 0
+        start = pos
+
+        byte = buf[pos]
+        pos += 1
+        type_code = (byte >> 4) & 0x07
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = buf[pos]
+            pos += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        base_offset = None
+        if type_code == OBJ_OFS_DELTA:
+            byte = buf[pos]
+            pos += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = buf[pos]
+                pos += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base_offset = offset - distance
+
+        data_start = offset + (pos - start)
+        data_end = self._entry_end(offset)
+        if self.use_mmap:
+            compressed = self._view[data_start:data_end]
+        else:
+            compressed = os.pread(self._file.fileno(), data_end - data_start, data_start)
+        data = zlib.decompress(compressed, bufsize=max(size, 1))
+        count("bytes.inflated", len(data))
+        if len(data) != size:
+            raise ValueError(f"Pack entry size mismatch at {offset} in {self.pack_path}")
+        return type_code, data, base_offset
+
+    # Rebuild the object at `offset`, following its delta chain. Every base
+    # rebuilt along the way goes into the shared object cache, so reading
+    # successive versions of a file does not replay the chain from scratch.
+    def read_at(self, offset):
+        target = offset
+        chain = []  # (offset, delta) from the target down towards the base
+        while True:
+            cached = object_cache.get((self.checksum, offset)) if chain else None
+            if cached is not None:
+                type_code, data = cached
+                break
+            type_code, data, base_offset = self._read_entry(offset)
+            if type_code != OBJ_OFS_DELTA:
+                if chain:
+                    object_cache.put((self.checksum, offset), (type_code, data), len(data))
+                break
+            chain.append((offset, data))
+            offset = base_offset
+
+        for delta_offset, delta in reversed(chain):
+            data = apply_delta(data, delta)
+            if delta_offset != target:
+                object_cache.put((self.checksum, delta_offset), (type_code, data), len(data))
+        return TYPE_NAMES[type_code], data
+
+    def read(self, oid):
+        offset = self.find(oid)
+        if offset is None:
+            return None
+        return self.read_at(offset)
+
+
+_packs = {}  # pack dir -> (dir mtime, [PackFile])
+
+
+# Packs in the current repository, reloaded only when the pack directory
+# changes so a long-running process sees the result of a later repack.
+def packs():
+    directory = pack_dir()
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    cached = _packs.get(directory)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    previous = {pack.idx_path: pack for pack in (cached[1] if cached else [])}
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".idx"):
+            path = os.path.join(directory, name)
+            found.append(previous.pop(path, None) or PackFile(path))
+    for stale in previous.values():
+        stale.close()
+    _packs[directory] = (mtime, found)
+    return found
+
+
+def find_object(oid):
+    for pack in packs():
+        offset = pack.find(oid)
+        if offset is not None:
+            return pack.read_at(offset)
+    return None
+
+
+def is_packed(oid):
+    return any(oid in pack for pack in packs())
+
+
+# --- writing ----------------------------------------------------------------
+
+def _entry_header(type_code, size):
+    byte = (type_code << 4) | (size & 0x0f)
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 0x7f
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+
+def _ofs_distance(distance):
+    out = bytearray([distance & 0x7f])
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.insert(0, 0x80 | (distance & 0x7f))
+        distance >>= 7
+    return bytes(out)
+
+
+# Write `objects` (an iterable of (oid, type, data) in the order they should
+# be stored) into a new pack. Each object is tried as a delta against the
+# previous DELTA_WINDOW objects of the same type; the smallest delta wins if
+# it saves at least half the size. Returns (pack path, object count, delta count).
+def write_pack(objects):
+    directory = pack_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_pack = tempfile.mkstemp(prefix="tmp_pack_", dir=directory)
+    offsets = {}
+    window = []  # (type, data, offset, depth)
+    deltas = 0
+    try:
+        with os.fdopen(fd, "w+b") as f:
+            # The object count is patched in once all objects are written
+            f.write(PACK_SIGNATURE + struct.pack(">II", PACK_VERSION, 0))
+            offset = f.tell()
+
+            for oid, type_, data in objects:
+                best = None
+                if len(data) <= MAX_DELTA_SOURCE:
+                    for base_type, base, base_offset, depth in window:
+                        if base_type != type_ or depth >= MAX_DELTA_DEPTH:
+                            continue
+                        delta = create_delta(base, data)
+                        if len(delta) < len(data) // 2 and (best is None or len(delta) < len(best[0])):
+                            best = (delta, base_offset, depth + 1)
+
+                if best:
+                    delta, base_offset, depth = best
+                    entry = _entry_header(OBJ_OFS_DELTA, len(delta)) + _ofs_distance(offset - base_offset)
+                    payload = delta
+                    deltas += 1
+                else:
+                    depth = 0
+                    entry = _entry_header(TYPE_CODES[type_], len(data))
+                    payload = data
+                compressed = zlib.compress(payload)
+                f.write(entry)
+                f.write(compressed)
+                offsets[oid] = offset
+
+                window.append((type_, data, offset, depth))
+                if len(window) > DELTA_WINDOW:
+                    window.pop(0)
+                offset += len(entry) + len(compressed)
+
+            f.seek(8)
+            f.write(struct.pack(">I", len(offsets)))
+            f.seek(0)
+            sha = hashlib.sha1()
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                sha.update(chunk)
+            checksum = sha.digest()
+            f.write(checksum)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp_pack)
+        raise
+
+    name = f"pack-{checksum.hex()}"
+    pack_path = os.path.join(directory, name + ".pack")
+    os.replace(tmp_pack, pack_path)
+    _write_index(os.path.join(directory, name + ".idx"), offsets, checksum)
+    return pack_path, len(offsets), deltas
+
+
+def _write_index(path, offsets, pack_checksum):
+    oids = sorted(bytes.fromhex(oid) for oid in offsets)
+    fanout = [0] * 256
+    for oid in oids:
+        fanout[oid[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    body = b"".join([
+        _IDX_HEADER.pack(IDX_SIGNATURE, PACK_VERSION),
+        _FANOUT.pack(*fanout),
+        b"".join(oids),
+        struct.pack(f">{len(oids)}Q", *(offsets[oid.hex()] for oid in oids)),
+        pack_checksum,
+    ])
+    # Readers discover packs through their .idx, so it is renamed into
+    # place last, after the pack itself is complete.
+    tmp_path = path + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(body + hashlib.sha1(body).digest())
+    os.replace(tmp_path, path)
@@ -1,30 +1,225 @@
 import os
-from vctrl.repo import repo_path
+from vctrl.repo import repo_path, current_repository
+from vctrl.trace import count, traced
 
-def update_ref(ref, oid):
-    path = os.path.join(repo_path(), ref)
-    with open(path, "w") as f:
-        f.write(oid)
+# Refs live either as loose files (.vctrl/refs/heads/main) or as lines in
+# .vctrl/packed-refs:
+#   # pack-refs with: sorted
+#   <oid> <ref name>
+# sorted by ref name, so a single ref is found by binary search over the
+# file without parsing it. A loose ref always wins over a packed one.
+PACKED_REFS_HEADER = "# pack-refs with: sorted\n"
+MAX_SYMREF_DEPTH = 5
 
-def get_ref(name):
-    path = os.path.join(repo_path(), name)
-    if not os.path.exists(path):
+# Per-process caches, keyed by path and checked against the file's stat
+# data, so a lookup costs one stat() unless the file changed
+_loose = {}   # path -> ((mtime, size, inode), value or None)
+_packed = {}  # path -> ((mtime, size, inode), PackedRefs)
+
+def _stat_key(path):
+    count("syscall.stat")
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+class PackedRefs:
+
+    def __init__(self, data):
+        self._data = data
+        self._start = 0
+        while data.startswith(b"#", self._start):
+            self._start = data.index(b"\n", self._start) + 1
+
+    # Start of the first line whose ref name is >= key
+    def _lower_bound(self, key):
+        data = self._data
+        lo, hi = self._start, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b"\n", lo, mid)
+            start = lo if start < 0 else start + 1
+            end = data.find(b"\n", start)
+            end = len(data) if end < 0 else end
+            if data[start + 41:end] < key:
+                lo = end + 1
+            else:
+                hi = start
+        return min(lo, len(data))
+
+    def _line_at(self, pos):
+        end = self._data.find(b"\n", pos)
+        end = len(self._data) if end < 0 else end
+        line = self._data[pos:end].decode("utf-8", "surrogateescape")
+        return line[41:], line[:40], end + 1
+
+    def get(self, name):
+        pos = self._lower_bound(name.encode("utf-8", "surrogateescape"))
+        if pos >= len(self._data):
+            return None
+        ref, oid, _ = self._line_at(pos)
+        return oid if ref == name else None
+
+    # (ref name, oid) for every packed ref starting with `prefix`, in order
+    def items(self, prefix=""):
+        pos = self._lower_bound(prefix.encode("utf-8", "surrogateescape"))
+        while pos < len(self._data):
+            ref, oid, pos = self._line_at(pos)
+            if not ref.startswith(prefix):
+                break
+            yield ref, oid
+
+def packed_refs_path():
+    return current_repository().packed_refs_path
+
+def packed_refs():
+    path = packed_refs_path()
+    key = _stat_key(path)
+    if key is None:
+        return PackedRefs(b"")
+    cached = _packed.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    count("refs.read_packed")
+    count("syscall.open")
+    with open(path, "rb") as f:
+        refs = PackedRefs(f.read())
+    _packed[path] = (key, refs)
+    return refs
+
+def _read_loose(path):
+    key = _stat_key(path)
+    if key is None:
+        _loose.pop(path, None)
         return None
+    cached = _loose.get(path)
+    if cached and cached[0] == key:
+        count("refs.cache_hit")
+        return cached[1]
+    count("refs.read")
+    count("syscall.open")
     with open(path) as f:
         value = f.read().strip()
-    if value.startswith("ref:"):
-        # resolve the referenced ref recursively
-        return get_ref(value[5:].strip())
+    _loose[path] = (key, value)
     return value
 
+# The raw value of a ref (an oid or "ref: <target>"), loose first
+def read_ref(name):
+    value = _read_loose(os.path.join(repo_path(), name))
+    if value is not None:
+        return value
+    return packed_refs().get(name)
+
+def get_ref(name):
+    # follow symbolic refs (HEAD -> refs/heads/main) iteratively
+    for _ in range(MAX_SYMREF_DEPTH):
+        value = read_ref(name)
+        if value is None or not value.startswith("ref:"):
+            return value
+        name = value[4:].strip()
+    raise RuntimeError(f"❌ Too many levels of symbolic refs at {name}")
+
+# Write a ref file through a lock file and a rename, so readers see the old
+# value or the new one and two writers can't interleave
+@traced("refs.update")
+def _write_ref_file(ref, value):
+    path = os.path.join(repo_path(), ref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_path = path + ".lock"
+    try:
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        raise RuntimeError(f"❌ Unable to lock {ref}: {lock_path} exists")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(value)
+        os.replace(lock_path, path)
+        count("refs.written")
+        count("syscall.open")
+        count("syscall.rename")
+    except BaseException:
+        if os.path.exists(lock_path):
+            os.unlink(lock_path)
+        raise
+
+def update_ref(ref, oid):
+    _write_ref_file(ref, oid)
+
+def update_symbolic_ref(ref, target):
+    _write_ref_file(ref, f"ref: {target}")
+
+def _loose_refs(root, prefix):
+    directory = os.path.join(root, prefix)
+    if not os.path.isdir(directory):
+        return
+    for dir_path, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".lock"):
+                continue
+            yield os.path.relpath(os.path.join(dir_path, name), root).replace(os.sep, "/")
+
+# Yield (ref name, oid) for every ref under `prefix` that points somewhere,
+# sorted by name, merging loose and packed refs
+def list_refs(prefix="refs/"):
+    root = repo_path()
+    found = dict(packed_refs().items(prefix))
+    for ref in _loose_refs(root, prefix.rstrip("/")):
+        found[ref] = get_ref(ref)
+    for ref in sorted(found):
+        if found[ref]:
+            yield ref, found[ref]
+
+# Move every loose ref into packed-refs and delete the loose files.
+# Returns the number of refs packed.
+def pack_refs():
+    root = repo_path()
+    refs = dict(packed_refs().items())
+    loose = {}
+    for ref in _loose_refs(root, "refs"):
+        value = read_ref(ref)
+        if value and not value.startswith("ref:"):
+            refs[ref] = loose[ref] = value
+
+    lines = [PACKED_REFS_HEADER]
+    lines.extend(f"{refs[ref]} {ref}\n" for ref in sorted(refs))
+    _write_ref_file("packed-refs", "".join(lines))
+
+    # A loose ref updated while we were packing is newer than its packed
+    # copy, so it is left in place
+    directories = set()
+    for ref, value in loose.items():
+        path = os.path.join(root, ref)
+        if read_ref(ref) == value:
+            os.unlink(path)
+            directories.add(os.path.dirname(path))
+
+    # Then drop directories left empty, deepest first (refs/heads stays)
+    keep = {os.path.join(root, "refs"), os.path.join(root, "refs", "heads")}
+    for directory in sorted(directories, key=len, reverse=True):
+        while directory not in keep and os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+    return len(refs)
+
 def get_branch_name():
-    head_path = os.path.join(repo_path(), "HEAD")
-    with open(head_path) as f:
-        data = f.read().strip()
-    if data.startswith("ref:"):
-        return data.split("/")[-1]  # return just the branch name
+    head = read_ref("HEAD")
+    if head and head.startswith("ref:"):
+        return head[4:].strip().removeprefix("refs/heads/")  # just the branch name
     return None  # detached HEAD
 
+# Turn "HEAD", a branch name, a full ref or a commit oid into a commit oid
+def resolve_commit(name):
+    from vctrl.objects import object_exists
+
+    if name == "HEAD" or name.startswith("refs/"):
+        return get_ref(name)
+    oid = get_ref(f"refs/heads/{name}")
+    if oid:
+        return oid
+    if object_exists(name):
+        return name
+    return None
+
 def get_ref_path(ref):
     return os.path.join(repo_path(), ref)
-
@@ -1,18 +1,148 @@
 import os
+import threading
+
+REPO_DIR = ".vctrl"
+
+# A repository handle: the .vctrl directory is found once and every path
+# inside it is computed up front. The functions in objects, index and refs
+# work on the active repository, which is the innermost `with repo:` block
+# or the one passed to open_repository, else the one containing the cwd.
+# `with` blocks only apply to the thread that entered them, so work handed
+# to other threads or processes must take the repository along (a
+# Repository pickles to its path). Discovery from the cwd is cached per
+# directory, so its cost no longer depends on how deep the cwd is.
+class Repository:
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError(f"❌ Not a vctrl repository: {self.path}")
+        self.root = os.path.dirname(self.path)
+        self.objects_dir = os.path.join(self.path, "objects")
+        self.pack_dir = os.path.join(self.objects_dir, "pack")
+        self.info_dir = os.path.join(self.objects_dir, "info")
+        self.index_path = os.path.join(self.path, "index")
+        self.packed_refs_path = os.path.join(self.path, "packed-refs")
+
+    def __repr__(self):
+        return f"Repository({self.path!r})"
+
+    # Walk up from `start` (default: the cwd) to the first directory with a
+    # .vctrl in it
+    @classmethod
+    def discover(cls, start=None):
+        current = os.path.abspath(start or os.getcwd())
+        while True:
+            candidate = os.path.join(current, REPO_DIR)
+            if os.path.isdir(candidate):
+                return cls(candidate)
+            parent = os.path.dirname(current)
+            if parent == current:
+                raise Exception("❌ Not inside a vctrl repository")
+            current = parent
+
+    def __enter__(self):
+        _active_stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _active_stack().pop()
+
+    def _call(self, func, *args, **kwargs):
+        with self:
+            return func(*args, **kwargs)
+
+    # Object, index and ref operations bound to this repository
+
+    def get_object(self, oid, expected_type=None):
+        from vctrl.objects import get_object
+        return self._call(get_object, oid, expected_type)
+
+    def hash_object(self, data, type_="blob"):
+        from vctrl.objects import hash_object
+        return self._call(hash_object, data, type_)
+
+    def object_exists(self, oid):
+        from vctrl.objects import object_exists
+        return self._call(object_exists, oid)
+
+    def read_commit(self, oid):
+        from vctrl.objects import read_commit
+        return self._call(read_commit, oid)
+
+    def read_tree(self, oid):
+        from vctrl.objects import read_tree
+        return self._call(read_tree, oid)
+
+    def flatten_tree(self, oid):
+        from vctrl.objects import flatten_tree
+        return self._call(flatten_tree, oid)
+
+    def read_index(self):
+        from vctrl.index import read_index
+        return self._call(read_index)
+
+    def get_ref(self, name):
+        from vctrl.refs import get_ref
+        return self._call(get_ref, name)
+
+    def update_ref(self, ref, oid):
+        from vctrl.refs import update_ref
+        return self._call(update_ref, ref, oid)
+
+    def list_refs(self, prefix="refs/"):
+        from vctrl.refs import list_refs
+        return self._call(lambda: list(list_refs(prefix)))
+
+    def resolve_commit(self, name):
+        from vctrl.refs import resolve_commit
+        return self._call(resolve_commit, name)
+
+
+_active = threading.local()  # .stack: repositories entered with `with` in this thread
+_default = None    # set by open_repository
+_discovered = {}   # cwd -> Repository
+
+
+# Open the repository at `path` (a worktree or its .vctrl directory) and
+# make it the default for this process
+def open_repository(path):
+    if os.path.basename(os.path.normpath(path)) != REPO_DIR:
+        path = os.path.join(path, REPO_DIR)
+    global _default
+    _default = Repository(path)
+    return _default
+
+
+def _active_stack():
+    try:
+        return _active.stack
+    except AttributeError:
+        _active.stack = []
+        return _active.stack
+
+
+def current_repository():
+    stack = _active_stack()
+    if stack:
+        return stack[-1]
+    if _default is not None:
+        return _default
+    cwd = os.getcwd()
+    repo = _discovered.get(cwd)
+    if repo is None:
+        repo = _discovered[cwd] = Repository.discover(cwd)
+    return repo
+
 
 def repo_path():
-    current = os.getcwd()
-    while current != "/":
-        candidate = os.path.join(current, ".vctrl")
-        if os.path.isdir(candidate):
-            return candidate
-        current = os.path.dirname(current)
-    raise Exception("❌ Not inside a vctrl repository")
+    return current_repository().path
+
 
 def init(path=None):
     if path is None:
         path = repo_path()
-    path = os.path.join(path, ".vctrl")
+    path = os.path.join(path, REPO_DIR)
     os.makedirs(os.path.join(path, "refs", "heads"), exist_ok=True)
     os.makedirs(os.path.join(path, "objects"), exist_ok=True)
 
@@ -22,6 +152,6 @@ def init(path=None):
     # ✅ Create empty main ref
     open(os.path.join(path, "refs", "heads", "main"), "w").close()
 
+    _discovered.clear()  # a cwd below `path` may have found an outer repo
     print(f"Initialised empty repo with path {path}")
     return path
-
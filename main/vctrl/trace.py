@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import threading
+import functools
+
+# Built-in instrumentation. Code counts events with count("objects.read")
+# and times phases with `with span("add.hash"):` or @traced("index.write");
+# spans nest per thread. Tracing is off unless VCTRL_TRACE (or the CLI's
+# --trace / --trace-file) turns it on for a command:
+#   VCTRL_TRACE=1          summary table of spans and counters on stderr
+#   VCTRL_TRACE=out.json   Chrome trace-event file (chrome://tracing,
+#                          ui.perfetto.dev), counters included
+# While off, count() and span() return at their first test and @traced
+# adds one function call, so the instrumentation can stay in hot paths.
+TRACE_ENV = "VCTRL_TRACE"
+
+_enabled = False
+_output = None     # Chrome trace path, or None for the summary table
+_origin = 0        # perf_counter_ns() when tracing started
+_events = []       # (name, start ns, duration ns, thread id)
+_counters = {}     # name -> total
+_lock = threading.Lock()
+
+
+def enabled():
+    return _enabled
+
+
+def count(name, n=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        _events.append((self.name, self.start, end - self.start, threading.get_ident()))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def traced(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Start collecting for one command. `setting` is "1" for a summary table, a
+# file name for a Chrome trace, or None to read VCTRL_TRACE. Returns
+# whether tracing is on.
+def start(setting=None):
+    global _enabled, _output, _origin
+    setting = setting or os.environ.get(TRACE_ENV, "")
+    if setting in ("", "0"):
+        return False
+    _events.clear()
+    _counters.clear()
+    _output = None if setting in ("1", "summary") else setting
+    _origin = time.perf_counter_ns()
+    _enabled = True
+    return True
+
+
+# Stop collecting and write the report
+def finish(out=None):
+    global _enabled
+    if not _enabled:
+        return
+    _enabled = False
+    if _output:
+        write_chrome_trace(_output)
+        print(f"🔎 Trace written to {_output}", file=out or sys.stderr)
+    else:
+        print_summary(out or sys.stderr)
+
+
+def write_chrome_trace(path):
+    import json
+
+    pid = os.getpid()
+    events = [{"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+               "ts": (start - _origin) / 1000, "dur": duration / 1000}
+              for name, start, duration, tid in _events]
+    end = max(((start + duration - _origin) / 1000 for _, start, duration, _ in _events), default=0)
+    events.extend({"name": name, "ph": "C", "pid": pid, "tid": 0, "ts": end, "args": {"value": value}}
+                  for name, value in sorted(_counters.items()))
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def print_summary(out):
+    totals = {}  # name -> [calls, total ns, max ns]
+    for name, _, duration, _ in _events:
+        entry = totals.setdefault(name, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+
+    out.write(f"\n{'span':<28} {'calls':>8} {'total (ms)':>11} {'mean (ms)':>10} {'max (ms)':>9}\n")
+    for name, (calls, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        out.write(f"{name:<28} {calls:>8} {total / 1e6:>11.2f} {total / calls / 1e6:>10.3f} "
+                  f"{longest / 1e6:>9.2f}\n")
+    if _counters:
+        out.write(f"\n{'counter':<28} {'value':>12}\n")
+        for name, value in sorted(_counters.items()):
+            out.write(f"{name:<28} {value:>12}\n")
@@ -0,0 +1,145 @@
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from vctrl.repo import REPO_DIR, current_repository
+from vctrl.ignore import load_ignore
+from vctrl.trace import count, span, traced
+
+# Directory listing and stat are syscalls that release the GIL, and on
+# network filesystems each one is a round trip, so directories are scanned
+# on a thread pool sized for I/O rather than for CPUs. With a warm cache on
+# a single core the pool costs more than it saves; VCTRL_SCAN_JOBS=1 scans
+# on the calling thread.
+SCAN_WORKERS = int(os.environ.get("VCTRL_SCAN_JOBS", 0)) or min(32, (os.cpu_count() or 1) * 4)
+
+
+# Where `start` sits below the top of the working tree, as a prefix for
+# matching ignore patterns ("" at the top)
+def _tree_prefix(start):
+    rel = os.path.relpath(os.path.abspath(start), current_repository().root)
+    return "" if rel == "." else rel.replace(os.sep, "/") + "/"
+
+
+# List one directory: returns ([(path, stat)] for its files, [(dir path,
+# relative path)] for the subdirectories still to scan). DirEntry answers
+# is_dir/is_file from the directory listing itself, so the only extra
+# syscall is one stat per file. Symlinks to files count as files; symlinked
+# directories are not followed, as with os.walk.
+def _scan_dir(directory, rel_dir, prefix, matcher):
+    files, subdirs = [], []
+    count("syscall.scandir")
+    try:
+        it = os.scandir(directory)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return files, subdirs  # removed or unreadable since it was listed
+    with it:
+        for entry in it:
+            rel_path = rel_dir + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != REPO_DIR and not matcher.is_ignored(prefix + rel_path, is_dir=True):
+                        subdirs.append((entry.path, rel_path + "/"))
+                elif entry.is_file() and not matcher.is_ignored(prefix + rel_path):
+                    files.append((rel_path, entry.stat()))
+            except FileNotFoundError:
+                continue  # deleted while we were looking at it
+    count("syscall.stat", len(files))
+    return files, subdirs
+
+
+# Yield (path, stat) for every file under `start` that is not ignored, with
+# paths relative to `start` and "/"-separated. Ignored directories are
+# pruned before they are listed. Directories are scanned concurrently on
+# `jobs` threads, so the order of the results is not defined.
+def scan(start=".", jobs=None):
+    matcher = load_ignore()
+    prefix = _tree_prefix(start)
+    jobs = jobs or SCAN_WORKERS
+
+    if jobs <= 1:
+        stack = [(start, "")]
+        while stack:
+            files, subdirs = _scan_dir(*stack.pop(), prefix, matcher)
+            yield from files
+            stack.extend(subdirs)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        pending = {pool.submit(_scan_dir, start, "", prefix, matcher)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for directory, rel_dir in subdirs:
+                    pending.add(pool.submit(_scan_dir, directory, rel_dir, prefix, matcher))
+                yield from files
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+_ignored_cache = [None, set(), set()]  # matcher, tracked paths, the ignored ones
+
+
+# Tracked paths that `matcher` ignores. A file system monitor never
+# reports them (it doesn't watch ignored directories, and drops events
+# for ignored names), so they are always looked at. Kept between calls
+# and updated for the paths added since, so a long-running process only
+# matches each tracked path once.
+def _ignored_tracked(tracked, matcher):
+    cached_matcher, known, ignored = _ignored_cache
+    if cached_matcher is not matcher:
+        known, ignored = set(), set()
+    if known != tracked.keys():
+        added = tracked.keys() - known
+        ignored = {path for path in ignored if path in tracked}
+        ignored.update(path for path in added if matcher.is_ignored(path))
+        _ignored_cache[:] = [matcher, set(tracked), ignored]
+    return ignored
+
+
+# The working-tree files that may differ from the index `tracked`
+# ({path: entry}), given the fsmonitor state saved with it. Returns
+# (token, {path: stat, or None if it is gone}, complete):
+#   - with a file system monitor running and a valid token, only paths it
+#     saw change since then, plus those the state lists as untracked or
+#     not clean, and tracked files that are ignored, are looked at; every
+#     other tracked file is known to match its entry (complete is False)
+#   - otherwise this is a full scan of the non-ignored files (complete is
+#     True) and tracked files missing from it may be gone or ignored
+# `token` is the one to save with the result, or None without a monitor.
+@traced("worktree.changed_files")
+def changed_files(tracked, state=None):
+    from vctrl import fsmonitor
+
+    token, changed = None, None
+    if _tree_prefix(".") == "":  # monitor paths are relative to the top
+        with span("fsmonitor.query"):
+            token, changed = fsmonitor.query(state.token if state else None)
+    if changed is None:
+        with span("worktree.scan"):
+            return token, dict(scan()), True
+
+    matcher = load_ignore()
+    paths = changed | set(state.untracked) | set(state.dirty)
+    paths |= _ignored_tracked(tracked, matcher)
+    found = {}
+    for directory in [path for path in paths if path.endswith("/")]:
+        for rel_path, st in scan(directory):
+            found[directory + rel_path] = st
+        # Tracked files of a directory that was removed or moved away
+        paths.update(path for path in tracked if path.startswith(directory))
+
+    for path in paths:
+        if path.endswith("/") or path in found:
+            continue
+        count("syscall.stat")
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            st = None
+        if st is not None and not stat.S_ISREG(st.st_mode):
+            st = None
+        if path in tracked or (st is not None and not matcher.is_ignored(path)):
+            found[path] = st
+    return token, found, False